@@ -0,0 +1,125 @@
+import json
+import os
+import re
+import shutil
+import threading
+
+from ultralytics.utils.torch_utils import strip_optimizer
+
+# Scores of the retained epoch checkpoints, kept in the weights folder so the policy survives a resume
+RETENTION_FILE = 'retention.json'
+
+# Epoch checkpoints are named like the ultralytics save_period files, so a resume finds them, and exported as fp16
+FP16_SUFFIX = '_fp16.pt'
+FP16_EXPORT = re.compile(r'epoch(\d+)_fp16\.pt$')
+EPOCH_FILE = re.compile(r'epoch\d+(_fp16)?\.pt(\.tmp)?$')
+
+# Function to choose the epochs to keep: the last 'keep_last' epochs plus the 'keep_best' best scores
+def epochs_to_keep(scores, keep_last=3, keep_best=3):
+    epochs = sorted(scores)
+    best = sorted(epochs, key=lambda epoch: scores[epoch], reverse=True)
+    return set(epochs[-keep_last:] if keep_last else []) | set(best[:keep_best])
+
+# Callbacks saving epoch checkpoints on a background thread and pruning them with the retention policy
+class CheckpointRetention:
+    def __init__(self, interval=1, keep_last=3, keep_best=3):
+        self.interval = interval
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.thread = None
+        self.error = None
+
+    # Function to register the callbacks on a YOLO model trained with save_period=-1, after the score stopper
+    def attach(self, model):
+        model.add_callback('on_train_start', self.on_train_start)
+        model.add_callback('on_train_epoch_end', self.on_train_epoch_end)
+        model.add_callback('on_model_save', self.on_model_save)
+        model.add_callback('on_fit_epoch_end', self.on_fit_epoch_end)
+        model.add_callback('on_train_end', self.on_train_end)
+
+    # Function to wait for the checkpoint being written, raising its error if the write failed
+    def barrier(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _scores(self, weights_dir):
+        try:
+            with open(os.path.join(weights_dir, RETENTION_FILE), 'r') as f:
+                return {int(epoch): score for epoch, score in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, last_path, weights_dir, epoch, score):
+        try:
+            # last.pt is copied through a temporary file, so an interrupted copy never looks like a checkpoint
+            checkpoint_path = os.path.join(weights_dir, f'epoch{epoch}.pt')
+            shutil.copyfile(last_path, f'{checkpoint_path}.tmp')
+            os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+
+            scores = {saved: saved_score for saved, saved_score in self._scores(weights_dir).items()
+                      if os.path.exists(os.path.join(weights_dir, f'epoch{saved}.pt'))}
+            scores[epoch] = score
+            keep = epochs_to_keep(scores, self.keep_last, self.keep_best)
+            for pruned in set(scores) - keep:
+                os.remove(os.path.join(weights_dir, f'epoch{pruned}.pt'))
+            with open(os.path.join(weights_dir, f'{RETENTION_FILE}.tmp'), 'w') as f:
+                json.dump({kept: scores[kept] for kept in sorted(keep)}, f, indent=1)
+            os.replace(os.path.join(weights_dir, f'{RETENTION_FILE}.tmp'), os.path.join(weights_dir, RETENTION_FILE))
+        except Exception as e:
+            self.error = e
+
+    def on_train_start(self, trainer):
+        if trainer.start_epoch != 0:
+            return
+        # A fresh run reuses the fold's save_dir, so the scores and epoch files of the previous run are removed,
+        # otherwise they would be ranked against the new epochs and exported at the end
+        weights_dir = str(trainer.wdir)
+        if not os.path.isdir(weights_dir):
+            return
+        with os.scandir(weights_dir) as entries:
+            stale = [entry.path for entry in entries if entry.name == RETENTION_FILE or EPOCH_FILE.match(entry.name)]
+        for stale_path in stale:
+            os.remove(stale_path)
+        if stale:
+            print(f"Removed {len(stale)} epoch checkpoints and retention scores of a previous run from {weights_dir}")
+
+    def on_train_epoch_end(self, trainer):
+        # The previous copy must be finished before save_model overwrites last.pt
+        self.barrier()
+
+    def on_model_save(self, trainer):
+        epoch = trainer.epoch + 1
+        if epoch % self.interval:
+            return
+        self.barrier()
+        score = float('-inf') if trainer.fitness is None else float(trainer.fitness)
+        self.thread = threading.Thread(target=self._write, args=(str(trainer.last), str(trainer.wdir), epoch, score),
+                                       daemon=True)
+        self.thread.start()
+
+    def on_fit_epoch_end(self, trainer):
+        # After the last epoch the final evaluation strips last.pt in place, so the copy has to be finished first
+        if trainer.stop or trainer.epoch + 1 >= trainer.epochs:
+            self.barrier()
+
+    def on_train_end(self, trainer):
+        self.barrier()
+
+        # Inference-only fp16 weights for the kept checkpoints, the exports of pruned ones are removed
+        weights_dir = str(trainer.wdir)
+        kept = set(self._scores(weights_dir))
+        with os.scandir(weights_dir) as entries:
+            exports = [(FP16_EXPORT.match(entry.name), entry.path) for entry in entries]
+        for match, export_path in exports:
+            if match and int(match.group(1)) not in kept:
+                os.remove(export_path)
+        for epoch in sorted(kept):
+            export_path = os.path.join(weights_dir, f'epoch{epoch}{FP16_SUFFIX}')
+            if not os.path.exists(export_path):
+                strip_optimizer(os.path.join(weights_dir, f'epoch{epoch}.pt'), s=export_path)
+        print(f"Kept epoch checkpoints {sorted(kept)} (last {self.keep_last} and best {self.keep_best} by score) "
+              f"with fp16 exports in {weights_dir}")
@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+# Weights of the combined score used to pick the best epoch (see Results/plot_best_epoch.py), losses are subtracted
+COMBINED_SCORE_WEIGHTS = {
+    'metrics/mAP50(B)': 0.25,
+    'metrics/precision(B)': 0.375,
+    'metrics/recall(B)': 0.375,
+    'val/box_loss': 0.5,
+    'val/cls_loss': 0.5,
+}
+
+# Key of the combined score added to the validation metrics, so it is also written to results.csv
+SCORE_KEY = 'metrics/combined_score'
+
+# File recording where a fold stopped and the compute saved, written in the training save directory
+EARLY_STOPPING_FILE = 'early_stopping.json'
+
+# Function to compute the combined score from validation metrics (a dict of floats or of pandas columns)
+def combined_score(metrics, weights=COMBINED_SCORE_WEIGHTS):
+    score = 0.0
+    for key, weight in weights.items():
+        if key.startswith('val/'):
+            score = score - metrics[key] * weight
+        else:
+            score = score + metrics[key] * weight
+    return score
+
+# Callbacks making the combined score the training fitness: it selects best.pt and drives early stopping
+class CombinedScoreStopper:
+    def __init__(self, patience=50, weights=None):
+        self.patience = patience
+        self.weights = {**COMBINED_SCORE_WEIGHTS, **(weights or {})}
+        self.record = None
+
+    # Function to register the callbacks on a YOLO model, trained with patience=0 so only this stopper applies
+    def attach(self, model):
+        model.add_callback('on_train_start', self.on_train_start)
+        model.add_callback('on_fit_epoch_end', self.on_fit_epoch_end)
+
+    def on_train_start(self, trainer):
+        validate = trainer.validate
+
+        # The trainer keeps the best fitness to choose best.pt, so it is set from the score instead of the fitness
+        def validate_with_score():
+            best_score = trainer.best_fitness
+            metrics, fitness = validate()
+            if metrics is None:
+                return metrics, fitness
+            score = float(combined_score(metrics, self.weights))
+            metrics[SCORE_KEY] = score
+            trainer.best_fitness = score if best_score is None or score > best_score else best_score
+            return metrics, score
+
+        trainer.validate = validate_with_score
+
+    def on_fit_epoch_end(self, trainer):
+        # The final evaluation of best.pt runs this callback again after the stop
+        if self.record is not None:
+            return
+
+        # The built-in stopper, disabled by patience=0, still tracks the best epoch and is saved in the checkpoints
+        epoch = trainer.epoch + 1
+        best_epoch = trainer.stopper.best_epoch
+        if epoch - best_epoch < self.patience or epoch >= trainer.epochs:
+            return
+        trainer.stop = True
+
+        # Compute saved: the remaining epochs at the mean epoch time of this run
+        mean_epoch_time = (time.time() - trainer.train_time_start) / max(1, epoch - trainer.start_epoch)
+        self.record = {
+            'best_epoch': best_epoch,
+            'best_score': float(trainer.stopper.best_fitness),
+            'stopped_epoch': epoch,
+            'planned_epochs': trainer.epochs,
+            'epochs_saved': trainer.epochs - epoch,
+            'estimated_seconds_saved': round((trainer.epochs - epoch) * mean_epoch_time, 1),
+            'patience': self.patience,
+            'weights': self.weights,
+        }
+        with open(os.path.join(trainer.save_dir, EARLY_STOPPING_FILE), 'w') as f:
+            json.dump(self.record, f, indent=1)
+        print(f"Early stopping at epoch {epoch}: no combined score improvement since epoch {best_epoch}, "
+              f"{trainer.epochs - epoch} epochs (~{self.record['estimated_seconds_saved'] / 3600:.2f} h) saved")
@@ -1,125 +1,217 @@
 import os
+import sys
 import numpy as np  # To calculate the average performance
-import torch
 from codecarbon import EmissionsTracker  # Import the CO2 tracker
 from ultralytics import YOLO
+from checkpoint_retention import CheckpointRetention
+from combined_score import CombinedScoreStopper
+from fold_scheduler import RUNNING, STATE_FOLDER, FoldScheduler, mark_fold_done, read_fold_state, write_fold_state
+from run_manifest import CheckpointRecorder, completed_folds, find_resume_checkpoint, finished_weights, start_run
+from training_utils import LoaderTimer, auto_workers, check_cache, select_device
+
+# The shard cache lives with the preprocessing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from shard_cache import fold_shard_dir, has_shards, make_shard_trainer, make_shard_validator
 
 # Automatically get the current directory and append the dataset folder
 current_dir = os.getcwd()
 dataset_path = os.path.join(current_dir, "dataset")
 
-# Check if GPU is available, otherwise raise an exception
-if not torch.cuda.is_available():
-    raise RuntimeError("CUDA-enabled GPU not found. The script requires a GPU with CUDA support to run.")
-
-# Set the device to GPU
-device = 'cuda'
+# Use the GPU when available, otherwise fall back to the CPU for small smoke runs
+device = select_device()
 
 # Log file for emissions tracking
 emissions_log_file = os.path.join(dataset_path, "co2_emissions_log.txt")
 
+# Folder of the run manifest and of the per-fold states (status, last checkpoint, results)
+state_dir = os.path.join(dataset_path, STATE_FOLDER)
+
 # Function to log emissions data
 def log_emissions(emissions, total=False):
     with open(emissions_log_file, 'a') as f:
         if total:
             f.write(f"Total CO2 emissions for all folds: {emissions:.4f} kg\n")
 
-# Function to perform cross-validation
-def run_cross_validation(num_folds=5, epochs=50, checkpoint_interval=10, resume_epoch=None):
-    fold_performances = []
-    total_emissions = 0.0
-
-    # Clear the emissions log file at the start
-    with open(emissions_log_file, 'w') as f:
-        f.write("CO2 Emissions Log\n==================\n")
-
-    for fold in range(1, num_folds + 1):
-        print(f"\n--- Fold {fold} ---")
-
-        # Paths for the current fold
-        train_images = os.path.join(dataset_path, f'fold_{fold}', 'training', 'images')
-        test_images = os.path.join(dataset_path, f'fold_{fold}', 'test', 'images')
-
-        # Create a temporary YAML file for each fold
-        data_yaml_content = f"""
-        train: {train_images}
-        val: {test_images}
-        nc: 1
-        names: ['fish']
-        """
-
-        data_yaml_path = os.path.join(dataset_path, f'fold_{fold}_data.yaml')
-        with open(data_yaml_path, 'w') as f:
-            f.write(data_yaml_content)
-
-        # Load the YOLOv8 model
-        model = YOLO('yolov8s.pt')
-
-        # Set the save directory for training and validation separately for clarity
-        train_save_dir = os.path.join(current_dir, "runs", "detect", f"train_fold_{fold}")
-        val_save_dir = os.path.join(current_dir, "runs", "detect", f"val_fold_{fold}")
-        
-        # Ensure directories exist
-        os.makedirs(train_save_dir, exist_ok=True)
-        os.makedirs(val_save_dir, exist_ok=True)
-
-        # If resuming from a checkpoint, load the last checkpoint
-        if resume_epoch is not None and resume_epoch > 0:
-            checkpoint_path = os.path.join(train_save_dir, f'weights/epoch_{resume_epoch}.pt')
-            if os.path.exists(checkpoint_path):
-                print(f"Resuming training for fold {fold} from epoch {resume_epoch}")
-                model = YOLO(checkpoint_path)  # Load model from checkpoint
-            else:
-                print(f"Checkpoint for epoch {resume_epoch} not found. Starting from scratch for fold {fold}.")
-                resume_epoch = None  # Reset resume_epoch if checkpoint is not found
-
-        # Start the emissions tracker
-        tracker = EmissionsTracker(log_level="WARNING")
-        try:
-            tracker.start()
-        except Exception as e:
-            print(f"Error starting emissions tracker: {e}")
-
-        # Training phase
+# Function to train and validate one fold, returning its validation results_dict and CO2 emissions (None if not measured)
+def train_fold(fold, epochs=50, checkpoint_interval=10, resume=False, run_started=0.0, workers=None, cache=False,
+               score_patience=50, score_weights=None, keep_checkpoints=3, device=device):
+    print(f"\n--- Fold {fold} ---")
+
+    # Data loader workers picked from the CPU cores unless given, and image cache mode (False, 'ram' or 'disk')
+    num_workers = auto_workers(batch=16, device=device) if workers is None else workers
+    cache = check_cache(cache)
+    print(f"Training on {device} with {num_workers} data loader workers, image cache: {cache}")
+
+    # Paths for the current fold
+    train_images = os.path.join(dataset_path, f'fold_{fold}', 'training', 'images')
+    test_images = os.path.join(dataset_path, f'fold_{fold}', 'test', 'images')
+
+    # Prefer the image-list files written by k_fold_division in 'list' mode
+    train_list = os.path.join(dataset_path, f'fold_{fold}', 'training.txt')
+    test_list = os.path.join(dataset_path, f'fold_{fold}', 'test.txt')
+    if os.path.exists(train_list) and os.path.exists(test_list):
+        train_images, test_images = train_list, test_list
+
+    # Prefer the pre-letterboxed shards written by shard_cache, read through a shard-aware trainer and validator
+    trainer, validator = None, None
+    train_shards = fold_shard_dir(dataset_path, fold, 'training')
+    test_shards = fold_shard_dir(dataset_path, fold, 'test')
+    if has_shards(train_shards) and has_shards(test_shards):
+        train_images, test_images = train_shards, test_shards
+        trainer, validator = make_shard_trainer(), make_shard_validator()
+
+    # Create a temporary YAML file for each fold
+    data_yaml_content = f"""
+    train: {train_images}
+    val: {test_images}
+    nc: 1
+    names: ['fish']
+    """
+
+    data_yaml_path = os.path.join(dataset_path, f'fold_{fold}_data.yaml')
+    with open(data_yaml_path, 'w') as f:
+        f.write(data_yaml_content)
+
+    # Load the YOLOv8 model
+    model = YOLO('yolov8s.pt')
+
+    # Set the save directory for training and validation separately for clarity
+    train_save_dir = os.path.join(current_dir, "runs", "detect", f"train_fold_{fold}")
+    val_save_dir = os.path.join(current_dir, "runs", "detect", f"val_fold_{fold}")
+
+    # Ensure directories exist
+    os.makedirs(train_save_dir, exist_ok=True)
+    os.makedirs(val_save_dir, exist_ok=True)
+
+    # When continuing a run, resume from the fold's latest valid checkpoint, or only validate if its training finished
+    weights_dir = os.path.join(train_save_dir, 'weights')
+    finished, checkpoint = None, None
+    if resume:
+        recorded = (read_fold_state(state_dir, fold) or {}).get('checkpoint')
+        finished = finished_weights(weights_dir, not_before=run_started)
+        checkpoint = None if finished else find_resume_checkpoint(weights_dir, run_started, recorded)
+    if finished:
+        print(f"Training for fold {fold} already finished, validating {finished}")
+        model = YOLO(finished)
+    elif checkpoint:
+        print(f"Resuming training for fold {fold} from {checkpoint[0]} after epoch {checkpoint[1] + 1}")
+        model = YOLO(checkpoint[0])  # Optimizer, EMA and learning rate schedule are restored by resume=True
+    else:
+        print(f"No checkpoint to resume from, training fold {fold} from scratch")
+
+    # Log the per-epoch loader wait and compute times in the training folder
+    LoaderTimer(device).attach(model)
+
+    # Record every checkpoint saved in the fold's state, so a crash resumes from the last good one
+    CheckpointRecorder(state_dir, fold).attach(model)
+
+    # Select best.pt and stop early on the combined validation score instead of the ultralytics fitness
+    score_stopper = CombinedScoreStopper(patience=score_patience, weights=score_weights)
+    score_stopper.attach(model)
+
+    # Copy the epoch checkpoints on a background thread, keeping the last and the best 'keep_checkpoints' by score
+    # (attached after the score stopper, whose stop decision it waits on before the final evaluation)
+    retention = CheckpointRetention(interval=checkpoint_interval, keep_last=keep_checkpoints, keep_best=keep_checkpoints)
+    retention.attach(model)
+
+    # Start the emissions tracker
+    tracker = EmissionsTracker(log_level="WARNING")
+    try:
+        tracker.start()
+    except Exception as e:
+        print(f"Error starting emissions tracker: {e}")
+
+    # Training phase
+    if finished is None:
         model.train(
             data=data_yaml_path,  # Use the generated YAML file
+            trainer=trainer,  # Shard trainer when the fold has shards
             epochs=epochs,  # Total number of epochs
             imgsz=640,  # Image size
             batch=16,  # Batch size for training
-            device=device,  # Use GPU
-            workers=0,  # Number of workers for validation
+            device=device,  # Use the selected device
+            workers=num_workers,  # Number of data loader workers
+            cache=cache,  # Cache the decoded images in RAM or on disk (unused with shards)
             plots=True,  # Save training plots
             save_dir=train_save_dir,  # Save training results in train_fold_X
-            save_period=checkpoint_interval,  # Save checkpoint every 'checkpoint_interval' epochs
-            resume=resume_epoch  # Resume from the specified epoch if provided
-        )
-
-        # Validation phase
-        val_results = model.val(
-            data=data_yaml_path,  # Use the same data.yaml
-            device=device,  # Run validation on GPU
-            batch=16,  # Batch size for validation
-            workers=0,  # Number of workers for validation
-            save_dir=val_save_dir,  # Save validation results in val_fold_X
+            save_period=-1,  # Epoch checkpoints every 'checkpoint_interval' epochs are written by CheckpointRetention
+            patience=0,  # Built-in early stopping disabled, the combined score stopper decides
+            resume=checkpoint is not None  # Resume from the checkpoint the model was loaded from
         )
-        print(f"Validation results for fold {fold}: {val_results}")
 
-        # Append validation results to calculate average later
-        fold_performances.append(val_results.results_dict)
-
-        try:
-            # Stop the emissions tracker and log the emissions produced
-            emissions = tracker.stop()
-            total_emissions += emissions
-            print(f"CO2 emitted for fold {fold}: {emissions:.4f} kg")
-
-        except Exception as e:
-            print(f"Error stopping emissions tracker or saving data: {e}")
+    if score_stopper.record is not None:
+        write_fold_state(state_dir, fold, early_stopping=score_stopper.record)
+
+    # Validation phase
+    val_results = model.val(
+        data=data_yaml_path,  # Use the same data.yaml
+        validator=validator,  # Shard validator when the fold has shards
+        device=device,  # Run validation on the selected device
+        batch=16,  # Batch size for validation
+        workers=num_workers,  # Number of workers for validation
+        save_dir=val_save_dir,  # Save validation results in val_fold_X
+    )
+    print(f"Validation results for fold {fold}: {val_results}")
+
+    emissions = None
+    try:
+        # Stop the emissions tracker and log the emissions produced
+        emissions = tracker.stop()
+        print(f"CO2 emitted for fold {fold}: {emissions:.4f} kg")
+
+    except Exception as e:
+        print(f"Error stopping emissions tracker or saving data: {e}")
+
+    # Validation results and emissions, aggregated over the folds by run_cross_validation
+    return val_results.results_dict, emissions
+
+# Function to perform cross-validation, one fold after another or on a FoldScheduler running folds concurrently
+def run_cross_validation(num_folds=5, epochs=50, checkpoint_interval=10, resume=True, workers=None, cache=False,
+                         score_patience=50, score_weights=None, keep_checkpoints=3, scheduler=None):
+    # Continue the previous run when its configuration matches, skipping the folds it finished
+    config = {'script': os.path.basename(__file__), 'num_folds': num_folds, 'epochs': epochs,
+              'checkpoint_interval': checkpoint_interval, 'score_patience': score_patience,
+              'score_weights': score_weights, 'keep_checkpoints': keep_checkpoints}
+    run, resumed = start_run(state_dir, config, num_folds, resume)
+    completed = completed_folds(state_dir, num_folds)
+    remaining_folds = [fold for fold in range(1, num_folds + 1) if fold not in completed]
+    if completed:
+        print(f"Continuing the run started at {run['started']:.0f}: folds {sorted(completed)} already done")
+
+    # Clear the emissions log file at the start of a new run
+    if not resumed:
+        with open(emissions_log_file, 'w') as f:
+            f.write("CO2 Emissions Log\n==================\n")
+
+    # Folds always look for a checkpoint: only those written since the run started are used, so a fold that
+    # crashed during a fresh run also resumes when it is retried
+    fold_kwargs = dict(epochs=epochs, checkpoint_interval=checkpoint_interval, resume=True, run_started=run['started'],
+                       workers=workers, cache=cache, score_patience=score_patience, score_weights=score_weights,
+                       keep_checkpoints=keep_checkpoints)
+    if scheduler is not None:
+        scheduler.run(train_fold, remaining_folds, **fold_kwargs)
+    else:
+        for fold in remaining_folds:
+            write_fold_state(state_dir, fold, status=RUNNING)
+            results, emissions = train_fold(fold, **fold_kwargs)
+            mark_fold_done(state_dir, fold, results, emissions)
+
+    # Append validation results to calculate average later, emissions summed when they were measured
+    states = completed_folds(state_dir, num_folds)
+    fold_performances = [states[fold]['results'] for fold in range(1, num_folds + 1)]
+    total_emissions = sum(states[fold]['emissions'] for fold in states if states[fold]['emissions'] is not None)
 
     # Calculate the average performance across all folds
     avg_map50 = np.mean([fold['metrics/mAP50(B)'] for fold in fold_performances])
     print(f"Average mAP50 across all folds: {avg_map50}")
 
+    # Compute saved by stopping the folds early on the combined score
+    early_stops = [state['early_stopping'] for state in states.values() if state.get('early_stopping')]
+    epochs_saved = sum(record['epochs_saved'] for record in early_stops)
+    hours_saved = sum(record['estimated_seconds_saved'] for record in early_stops) / 3600
+    print(f"Early stopping saved {epochs_saved} of {num_folds * epochs} epochs (~{hours_saved:.2f} h) "
+          f"in {len(early_stops)} folds")
+
     # Log total CO2 emissions to the file
     log_emissions(emissions=total_emissions, total=True)
 
@@ -127,5 +219,9 @@ def run_cross_validation(num_folds=5, epochs=50, checkpoint_interval=10, resume_
     print(f"Total CO2 emissions for {num_folds} folds: {total_emissions:.4f} kg")
 
 if __name__ == '__main__':
+    # Run the folds concurrently as separate processes, one per GPU (or on the CPU), with per-fold state files
+    concurrent_folds = False
+    scheduler = FoldScheduler(state_dir, folds_per_device=1) if concurrent_folds else None
+
     # Start cross validation
-    run_cross_validation(num_folds=5, epochs=300, checkpoint_interval=1)
+    run_cross_validation(num_folds=5, epochs=300, checkpoint_interval=1, scheduler=scheduler)
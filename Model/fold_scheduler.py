@@ -0,0 +1,139 @@
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import torch
+
+# Folder of the per-fold state files and logs, kept in the dataset folder
+STATE_FOLDER = 'fold_state'
+
+# States of a fold during a scheduled run
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+# Function to get the path of the state file of a fold
+def fold_state_path(state_dir, fold):
+    return os.path.join(state_dir, f'fold_{fold}.json')
+
+# Function to read the state of a fold, or None when it has none
+def read_fold_state(state_dir, fold):
+    try:
+        with open(fold_state_path(state_dir, fold), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Function to update the state of a fold through a temporary file, so a crash never leaves a truncated state
+def write_fold_state(state_dir, fold, **updates):
+    state = {**(read_fold_state(state_dir, fold) or {}), 'fold': fold, 'updated': time.time(), **updates}
+    state_path = fold_state_path(state_dir, fold)
+    # The fold's process and the scheduler both update the state, so each writes its own temporary file
+    tmp_path = f'{state_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, state_path)
+    return state
+
+# Function to record the validation results_dict and emissions of a finished fold
+def mark_fold_done(state_dir, fold, results, emissions, **updates):
+    return write_fold_state(state_dir, fold, status=DONE, results={key: float(value) for key, value in results.items()},
+                            emissions=emissions, error=None, **updates)
+
+# Function run in the fold's own process: train the fold and record its results in the state file
+def _run_fold(train_fold, fold, device, threads, attempts, state_dir, train_kwargs):
+    # The fold's output goes to its own log instead of being interleaved with the other folds
+    log_file = open(os.path.join(state_dir, f'fold_{fold}.log'), 'a')
+    os.dup2(log_file.fileno(), 1)
+    os.dup2(log_file.fileno(), 2)
+    torch.set_num_threads(threads)
+    try:
+        results, emissions = train_fold(fold, device=device, **train_kwargs)
+        mark_fold_done(state_dir, fold, results, emissions, attempts=attempts, device=device)
+    except BaseException:
+        traceback.print_exc()
+        write_fold_state(state_dir, fold, status=FAILED, attempts=attempts, device=device,
+                         error=traceback.format_exc(limit=5))
+        raise
+
+# Scheduler running independent folds as separate processes, within a budget of devices, CPU threads and memory
+class FoldScheduler:
+    def __init__(self, state_dir, devices=None, folds_per_device=1, cpu_threads=None, memory_gb=None,
+                 memory_per_fold_gb=None, max_retries=1):
+        self.state_dir = state_dir
+        if devices is None:
+            devices = [f'cuda:{i}' for i in range(torch.cuda.device_count())] or ['cpu']
+        self.devices = list(devices)
+        self.max_retries = max_retries
+
+        # Number of folds running together: one per device slot, unless CPU threads or memory run out first
+        self.slots = len(self.devices) * folds_per_device
+        self.cpu_threads = cpu_threads or os.cpu_count() or 1
+        if memory_per_fold_gb:
+            if memory_gb is None:
+                import psutil
+                memory_gb = psutil.virtual_memory().total / 1e9
+            self.slots = min(self.slots, int(memory_gb // memory_per_fold_gb))
+        self.slots = max(1, min(self.slots, self.cpu_threads))
+        self.threads_per_fold = max(1, self.cpu_threads // self.slots)
+        self.device_slots = [device for _ in range(folds_per_device) for device in self.devices]
+
+    # Function to train the folds and return their results_dict in fold order and the summed emissions
+    def run(self, train_fold, folds, **train_kwargs):
+        os.makedirs(self.state_dir, exist_ok=True)
+        folds = list(folds)
+        states = {fold: write_fold_state(self.state_dir, fold, status=PENDING, attempts=0) for fold in folds}
+
+        # Loader workers share the fold's CPU threads with the training process
+        if train_kwargs.get('workers') is None:
+            train_kwargs['workers'] = max(0, self.threads_per_fold - 1)
+        print(f"Scheduling {len(folds)} folds on {self.slots} slots ({', '.join(self.device_slots[:self.slots])}), "
+              f"{self.threads_per_fold} CPU threads each. Fold logs and states in: {self.state_dir}")
+
+        # CUDA cannot be used in forked processes, so every fold starts a fresh interpreter
+        context = multiprocessing.get_context('spawn')
+        pending = list(folds)
+        running = {}  # sentinel: (process, fold, device)
+        free_devices = self.device_slots[:self.slots]
+        while pending or running:
+            while pending and free_devices:
+                fold, device = pending.pop(0), free_devices.pop(0)
+                attempts = states[fold]['attempts'] + 1
+                process = context.Process(target=_run_fold, args=(train_fold, fold, device, self.threads_per_fold,
+                                                                  attempts, self.state_dir, train_kwargs))
+                process.start()
+                states[fold] = write_fold_state(self.state_dir, fold, status=RUNNING, attempts=attempts,
+                                                device=device, pid=process.pid)
+                running[process.sentinel] = (process, fold, device)
+                print(f"Fold {fold} started on {device} (attempt {attempts}, pid {process.pid})")
+
+            for sentinel in wait(list(running)):
+                process, fold, device = running.pop(sentinel)
+                process.join()
+                free_devices.append(device)
+                state = read_fold_state(self.state_dir, fold) or {}
+                if process.exitcode == 0 and state.get('status') == DONE:
+                    states[fold] = state
+                    print(f"Fold {fold} done: mAP50 {state['results'].get('metrics/mAP50(B)', float('nan')):.4f}")
+                    continue
+
+                # A process killed by the system (e.g. out of memory) never wrote its failure
+                if state.get('status') != FAILED:
+                    state = write_fold_state(self.state_dir, fold, status=FAILED, attempts=states[fold]['attempts'],
+                                             device=device, error=f"Process exited with code {process.exitcode}")
+                states[fold] = state
+                if state['attempts'] <= self.max_retries:
+                    print(f"Fold {fold} failed on attempt {state['attempts']}, retrying")
+                    pending.append(fold)
+                else:
+                    print(f"Fold {fold} failed after {state['attempts']} attempts, see {self.state_dir}")
+
+        failed = [fold for fold in folds if states[fold]['status'] != DONE]
+        if failed:
+            raise RuntimeError(f"Folds {failed} failed, their states and logs are in {self.state_dir}")
+
+        # Same aggregation as the serial loop: results in fold order, emissions summed when they were measured
+        fold_performances = [states[fold]['results'] for fold in folds]
+        total_emissions = sum(states[fold]['emissions'] for fold in folds if states[fold]['emissions'] is not None)
+        return fold_performances, total_emissions
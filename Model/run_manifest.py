@@ -0,0 +1,99 @@
+import json
+import os
+import re
+import time
+
+import torch
+
+from fold_scheduler import DONE, fold_state_path, read_fold_state, write_fold_state
+
+# Run manifest, kept with the fold states: the run configuration and its start time
+RUN_FILE = 'run_manifest.json'
+
+# Checkpoints written by ultralytics with save_period, 'epoch{N}.pt' in the weights folder
+EPOCH_CHECKPOINT = re.compile(r'epoch(\d+)\.pt$')
+
+# Function to start or continue a run, returning the run manifest and whether it continues the previous run
+def start_run(state_dir, config, num_folds, resume=True):
+    os.makedirs(state_dir, exist_ok=True)
+    run_path = os.path.join(state_dir, RUN_FILE)
+    try:
+        with open(run_path, 'r') as f:
+            run = json.load(f)
+    except (OSError, ValueError):
+        run = None
+
+    # Only a run with the same configuration is continued, otherwise its fold states are forgotten
+    if resume and run is not None and run.get('config') == config:
+        return run, True
+    for fold in range(1, num_folds + 1):
+        if os.path.exists(fold_state_path(state_dir, fold)):
+            os.remove(fold_state_path(state_dir, fold))
+    run = {'config': config, 'started': time.time()}
+    with open(f'{run_path}.tmp', 'w') as f:
+        json.dump(run, f, indent=1)
+    os.replace(f'{run_path}.tmp', run_path)
+    return run, False
+
+# Function to get the states of the folds already finished in the run, by fold
+def completed_folds(state_dir, num_folds):
+    states = {fold: read_fold_state(state_dir, fold) for fold in range(1, num_folds + 1)}
+    return {fold: state for fold, state in states.items() if state and state.get('status') == DONE}
+
+# Function to load a checkpoint and return its epoch, -1 for a finished (stripped) one, or None when it is unreadable
+def checkpoint_epoch(checkpoint_path):
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+    except Exception:
+        # Truncated by a crash during the write
+        return None
+    if checkpoint.get('optimizer') is None:
+        return -1
+    return checkpoint.get('epoch', -1)
+
+# Function to list the checkpoints of a weights folder written since 'not_before', most recent epoch first
+def _candidate_checkpoints(weights_dir, not_before, recorded=None):
+    if not os.path.isdir(weights_dir):
+        return []
+    epoch_files = []
+    with os.scandir(weights_dir) as entries:
+        for entry in entries:
+            match = EPOCH_CHECKPOINT.match(entry.name)
+            if match:
+                epoch_files.append((int(match.group(1)), entry.path))
+    candidates = [recorded, os.path.join(weights_dir, 'last.pt')]
+    candidates += [path for _, path in sorted(epoch_files, reverse=True)]
+    checkpoints = []
+    for path in candidates:
+        if path and path not in checkpoints and os.path.exists(path) and os.path.getmtime(path) >= not_before:
+            checkpoints.append(path)
+    return checkpoints
+
+# Function to find the latest checkpoint a fold can resume from (optimizer state included), as (path, epoch)
+def find_resume_checkpoint(weights_dir, not_before=0.0, recorded=None):
+    for checkpoint_path in _candidate_checkpoints(weights_dir, not_before, recorded):
+        epoch = checkpoint_epoch(checkpoint_path)
+        if epoch is not None and epoch >= 0:
+            return checkpoint_path, epoch
+    return None
+
+# Function to get the best weights of a fold whose training finished in the run, or None
+def finished_weights(weights_dir, not_before=0.0):
+    last_path = os.path.join(weights_dir, 'last.pt')
+    if last_path not in _candidate_checkpoints(weights_dir, not_before) or checkpoint_epoch(last_path) != -1:
+        return None
+    best_path = os.path.join(weights_dir, 'best.pt')
+    return best_path if os.path.exists(best_path) else last_path
+
+# Callback recording the last checkpoint saved by a fold in its state file
+class CheckpointRecorder:
+    def __init__(self, state_dir, fold):
+        self.state_dir = state_dir
+        self.fold = fold
+
+    # Function to register the callback on a YOLO model before model.train
+    def attach(self, model):
+        model.add_callback('on_model_save', self.on_model_save)
+
+    def on_model_save(self, trainer):
+        write_fold_state(self.state_dir, self.fold, checkpoint=str(trainer.last), epoch=trainer.epoch + 1)
@@ -0,0 +1,82 @@
+import csv
+import os
+import time
+
+import torch
+
+# Image cache modes accepted by the ultralytics 'cache' argument
+CACHE_MODES = (False, 'ram', 'disk')
+
+# File of the per-epoch loader timings, written in the training save directory
+LOADER_TIMING_FILE = 'loader_timing.csv'
+
+# Function to pick the training device: the GPU when CUDA is available, otherwise the CPU for smoke runs
+def select_device(device=None):
+    if device is not None:
+        return device
+    if torch.cuda.is_available():
+        return 'cuda'
+    print("CUDA-enabled GPU not found, training on the CPU. Expect much slower epochs than on a GPU.")
+    return 'cpu'
+
+# Function to choose the number of data loader workers from the CPU cores, the devices and the batch size
+def auto_workers(batch, device, max_workers=8):
+    cpu_count = os.cpu_count() or 1
+    if str(device).startswith('cuda'):
+        # Every GPU gets its share of cores, one of them kept for the training process
+        return max(1, min(cpu_count // max(1, torch.cuda.device_count()) - 1, batch, max_workers))
+    # On the CPU the workers compete with the training threads, so they get half of the cores
+    return max(0, min(cpu_count // 2, batch, max_workers))
+
+# Function to check the image cache mode, returning it in the form expected by ultralytics
+def check_cache(cache):
+    if cache not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode {cache!r}, expected one of {CACHE_MODES}")
+    return cache
+
+# Callbacks measuring, per epoch, the time spent waiting for the data loader against the time spent computing
+class LoaderTimer:
+    def __init__(self, device):
+        # CUDA kernels run asynchronously, so the compute time is only measured after a synchronisation
+        self.synchronize = str(device).startswith('cuda')
+        self.mark = None
+        self.batches, self.wait_time, self.compute_time = 0, 0.0, 0.0
+
+    # Function to register the callbacks on a YOLO model before model.train
+    def attach(self, model):
+        model.add_callback('on_train_epoch_start', self.on_train_epoch_start)
+        model.add_callback('on_train_batch_start', self.on_train_batch_start)
+        model.add_callback('on_train_batch_end', self.on_train_batch_end)
+        model.add_callback('on_train_epoch_end', self.on_train_epoch_end)
+
+    def on_train_epoch_start(self, trainer):
+        self.batches, self.wait_time, self.compute_time = 0, 0.0, 0.0
+        self.mark = time.perf_counter()
+
+    def on_train_batch_start(self, trainer):
+        now = time.perf_counter()
+        self.wait_time += now - self.mark
+        self.mark = now
+
+    def on_train_batch_end(self, trainer):
+        if self.synchronize:
+            torch.cuda.synchronize(trainer.device)
+        now = time.perf_counter()
+        self.compute_time += now - self.mark
+        self.batches += 1
+        self.mark = now
+
+    def on_train_epoch_end(self, trainer):
+        total_time = self.wait_time + self.compute_time
+        wait_fraction = self.wait_time / total_time if total_time else 0.0
+        print(f"Epoch {trainer.epoch + 1}: loader wait {self.wait_time:.1f} s, compute {self.compute_time:.1f} s "
+              f"({wait_fraction:.1%} waiting on data over {self.batches} batches)")
+
+        timing_path = os.path.join(trainer.save_dir, LOADER_TIMING_FILE)
+        write_header = not os.path.exists(timing_path)
+        with open(timing_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(['epoch', 'batches', 'wait_s', 'compute_s', 'wait_fraction'])
+            writer.writerow([trainer.epoch + 1, self.batches, f"{self.wait_time:.3f}", f"{self.compute_time:.3f}",
+                             f"{wait_fraction:.4f}"])
@@ -0,0 +1,30 @@
+import hashlib
+import os
+
+# Image extensions of the dataset, compared against lower-cased file names by every script that lists images
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
+
+# Function to check whether a file name is an image, whatever the case of its extension
+def is_image_file(file_name):
+    return file_name.lower().endswith(IMAGE_EXTENSIONS)
+
+# Function to compute the SHA-1 of a file's content
+def file_sha1(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to find the YOLO label of an image: in the sibling 'labels' folder of an 'images' folder (the ultralytics
+# layout), or a .txt next to it. 'exists' checks a candidate, e.g. against the files of an earlier directory scan
+def label_path_for(image_path, exists=os.path.exists):
+    stem = os.path.splitext(image_path)[0]
+    candidates = [f'{stem}.txt']
+    images_part = f'{os.sep}images{os.sep}'
+    if images_part in stem:
+        candidates.insert(0, f'{f"{os.sep}labels{os.sep}".join(stem.rsplit(images_part, 1))}.txt')
+    for candidate in candidates:
+        if exists(candidate):
+            return candidate
+    return None
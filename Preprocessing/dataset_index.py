@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from dataset_files import file_sha1, is_image_file, label_path_for
+
+# SQLite file of the index, kept at the root of the indexed tree
+INDEX_FILE = 'dataset_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    sha1 TEXT NOT NULL,
+    label_path TEXT,
+    label_mtime_ns INTEGER,
+    label_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS images_folder ON images (folder);
+"""
+
+# Function to count the boxes of a YOLO label file, or None when there is no label
+def count_label_boxes(label_path):
+    if label_path is None:
+        return None
+    with open(label_path, 'r') as f:
+        return sum(1 for line in f if line.strip())
+
+# Function to read the size and format of an image from its header, without decoding the pixels
+def probe_image(image_path):
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+            return width, height, image.format
+    except Exception:
+        # Unreadable images stay in the index without a size, so they are excluded from the file lists
+        return None, None, None
+
+# Function to walk a tree with os.scandir, returning the images as {path: (size, mtime_ns)} and all files' mtimes
+def scan_tree(root):
+    images, file_mtimes = {}, {}
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    file_mtimes[entry.path] = stat.st_mtime_ns
+                    if is_image_file(entry.name):
+                        images[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return images, file_mtimes
+
+# SQLite index of the images of a tree: header size and format, content hash and label box count
+class DatasetIndex:
+    def __init__(self, root, index_path=None, num_threads=8, update=True):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path or os.path.join(self.root, INDEX_FILE)
+        self.num_threads = num_threads
+        self.connection = sqlite3.connect(self.index_path)
+        self.connection.executescript(SCHEMA)
+        if update:
+            self.update()
+
+    def _absolute(self, relative_path):
+        return os.path.join(self.root, relative_path)
+
+    def _probe(self, image_path, label_path):
+        width, height, image_format = probe_image(image_path)
+        return width, height, image_format, file_sha1(image_path), count_label_boxes(label_path)
+
+    # Function to index new and modified images and labels and drop the deleted ones
+    def update(self):
+        start_time = time.perf_counter()
+        images, file_mtimes = scan_tree(self.root)
+        indexed = {path: (size, mtime_ns, label_path, label_mtime_ns) for path, size, mtime_ns, label_path, label_mtime_ns
+                   in self.connection.execute("SELECT path, size, mtime_ns, label_path, label_mtime_ns FROM images")}
+
+        # Only stat information is compared, images are probed and hashed when they are new or modified
+        to_probe, label_updates = [], []
+        for image_path, (size, mtime_ns) in images.items():
+            relative_path = os.path.relpath(image_path, self.root)
+            label_path = label_path_for(image_path, exists=file_mtimes.__contains__)
+            label_mtime_ns = file_mtimes.get(label_path)
+            relative_label = os.path.relpath(label_path, self.root) if label_path else None
+            row = indexed.get(relative_path)
+            if row is None or row[:2] != (size, mtime_ns):
+                to_probe.append((image_path, relative_path, size, mtime_ns, label_path, relative_label, label_mtime_ns))
+            elif row[2:] != (relative_label, label_mtime_ns):
+                label_updates.append((relative_label, label_mtime_ns, count_label_boxes(label_path), relative_path))
+
+        # Header reads and hashing are I/O bound, so they run on a thread pool
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            probes = executor.map(lambda item: self._probe(item[0], item[4]), to_probe)
+            rows = [(relative_path, os.path.dirname(relative_path), os.path.basename(relative_path), size, mtime_ns,
+                     *probe[:4], relative_label, label_mtime_ns, probe[4])
+                    for (_, relative_path, size, mtime_ns, _, relative_label, label_mtime_ns), probe in zip(to_probe, probes)]
+
+        current = {os.path.relpath(image_path, self.root) for image_path in images}
+        removed = [(path,) for path in indexed if path not in current]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.executemany("UPDATE images SET label_path = ?, label_mtime_ns = ?, label_count = ? "
+                                        "WHERE path = ?", label_updates)
+            self.connection.executemany("DELETE FROM images WHERE path = ?", removed)
+        print(f"Dataset index updated in {time.perf_counter() - start_time:.2f} s: {len(rows)} images probed, "
+              f"{len(label_updates)} labels re-counted, {len(removed)} removed, {len(images)} indexed")
+
+    # Function to list the readable images of a folder by name, in the same order as a sorted directory listing
+    def image_files(self, folder_path):
+        folder = os.path.relpath(os.path.abspath(folder_path), self.root)
+        folder = '' if folder == '.' else folder
+        rows = self.connection.execute("SELECT name FROM images WHERE folder = ? AND width IS NOT NULL ORDER BY name",
+                                       (folder,))
+        return [name for name, in rows]
+
+    # Function to list the readable images of the whole tree as absolute paths
+    def image_paths(self, labelled_only=False):
+        query = "SELECT path FROM images WHERE width IS NOT NULL"
+        if labelled_only:
+            query += " AND label_count IS NOT NULL"
+        return [self._absolute(path) for path, in self.connection.execute(query + " ORDER BY path")]
+
+    # Function to get the indexed information of an image as a dictionary, or None when it is not indexed
+    def info(self, relative_path):
+        cursor = self.connection.execute("SELECT * FROM images WHERE path = ?", (relative_path,))
+        row = cursor.fetchone()
+        return None if row is None else dict(zip([column[0] for column in cursor.description], row))
+
+    # Function to summarise the index: image and box counts, unreadable images and image sizes
+    def summary(self):
+        images, unreadable, unlabelled, boxes = self.connection.execute(
+            "SELECT COUNT(*), SUM(width IS NULL), SUM(label_count IS NULL), COALESCE(SUM(label_count), 0) FROM images"
+        ).fetchone()
+        sizes = self.connection.execute("SELECT width, height, COUNT(*) FROM images WHERE width IS NOT NULL "
+                                        "GROUP BY width, height ORDER BY COUNT(*) DESC").fetchall()
+        return {'images': images, 'unreadable': unreadable or 0, 'unlabelled': unlabelled or 0, 'boxes': boxes,
+                'sizes': {f'{width}x{height}': count for width, height, count in sizes}}
+
+    def close(self):
+        self.connection.close()
+
+if __name__ == '__main__':
+    # Root of the dataset tree to index
+    dataset_root = '/Users/emsar/OneDrive/Desktop/materiale progetto cv/Output fold'
+
+    # Index (or update the index of) the tree and print a summary
+    index = DatasetIndex(dataset_root)
+    print(index.summary())
+    index.close()
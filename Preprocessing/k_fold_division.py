@@ -1,67 +1,209 @@
+import hashlib
+import json
 import os
-import random
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def divide_images_and_texts_into_groups(image_folder, output_folder, num_groups=5):
-    # List all images in the folder
-    images = [f for f in os.listdir(image_folder) if f.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]  # Filtra solo le immagini
-    
-    # Sort and randomly shuffle the images
-    images.sort()
-    random.shuffle(images)
-    
-    # Determine the number of images per group
-    num_images_per_group = len(images) // num_groups
-    remainder = len(images) % num_groups
-
-    # Create the groups of images
-    groups = []
-    index = 0
-    for i in range(num_groups):
-        group_size = num_images_per_group + (1 if i < remainder else 0)
-        group = images[index:index + group_size]
-        groups.append(group)
-        index += group_size
-
-    # Create the folder structure if it doesn't already exist
+from dataset_files import is_image_file
+
+# Ways of materialising the folds: image-list files, hard links, symbolic links or full copies.
+# Hard links (the default) cost no disk space and give every fold split its own labels folder, so ultralytics keeps a
+# separate label cache per split. In 'list' mode every split points at the source folder and shares its single
+# '<labels folder>.cache': each dataset build finds the cache made for another split, rescans all the labels and
+# rewrites it, and folds trained concurrently by a FoldScheduler race on that file
+MATERIALISE_MODES = ('list', 'hardlink', 'symlink', 'copy')
+
+# Fold assignments, mode and file stamps of every image seen so far, kept in the output folder
+MANIFEST_FILE = 'fold_manifest.json'
+
+# Function to describe an image and its label by size and mtime, so edited files are placed again
+def file_stamp(image_folder, image):
+    stamp = []
+    for name in (image, f"{os.path.splitext(image)[0]}.txt"):
+        try:
+            stat = os.stat(os.path.join(image_folder, name))
+            stamp.append([stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            stamp.append(None)
+    return stamp
+
+# Function to place one file in a fold tree, returning the number of bytes written
+def materialise_file(source, destination, mode):
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if mode == 'hardlink':
+        try:
+            os.link(source, destination)
+            return 0
+        except OSError:
+            # Hard links cannot cross filesystems, fall back to a copy
+            pass
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(source), destination)
+        return 0
+    shutil.copy(source, destination)
+    return os.path.getsize(destination)
+
+# Function to write the data YAML of a fold in the format used by the training scripts
+def write_fold_data_yaml(output_folder, fold_index, train_source, test_source):
+    data_yaml_path = os.path.join(output_folder, f'fold_{fold_index + 1}_data.yaml')
+    with open(data_yaml_path, 'w') as f:
+        f.write(f"train: {train_source}\nval: {test_source}\nnc: 1\nnames: ['fish']\n")
+    return data_yaml_path
+
+# Function to assign a key (image name or its survey) to a fold from its hash, stable across runs and machines
+def assign_fold(key, num_groups):
+    digest = hashlib.sha1(key.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % num_groups
+
+# Function to load the manifest of previous runs: {image: fold index} assignments, mode and {image: stamp}
+def load_fold_manifest(output_folder, num_groups):
+    manifest_path = os.path.join(output_folder, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}, None, {}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest['num_groups'] != num_groups:
+        raise ValueError(f"{output_folder} was divided into {manifest['num_groups']} folds, use a new output folder "
+                         f"to change the number of folds.")
+    return manifest['assignments'], manifest.get('mode'), manifest.get('stamps', {})
+
+# Function to save the fold assignments, mode and stamps, replacing the manifest atomically
+def save_fold_manifest(output_folder, num_groups, assignments, mode, stamps):
+    manifest_path = os.path.join(output_folder, MANIFEST_FILE)
+    with open(f'{manifest_path}.tmp', 'w') as f:
+        json.dump({'num_groups': num_groups, 'mode': mode, 'assignments': dict(sorted(assignments.items())),
+                   'stamps': dict(sorted(stamps.items()))}, f, indent=1)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+# Function to check that no fold deviates from the mean size by more than 'tolerance', raising when 'strict'
+def check_fold_balance(assignments, num_groups, tolerance=0.1, strict=False):
+    counts = [0] * num_groups
+    for fold_index in assignments.values():
+        counts[fold_index] += 1
+    mean = len(assignments) / num_groups
+    deviation = max(abs(count - mean) for count in counts) / mean if mean else 0.0
+    print(f"Images per fold: {counts} (largest deviation from the mean: {100 * deviation:.1f}%)")
+    if deviation > tolerance and strict:
+        raise ValueError(f"The folds are unbalanced by {100 * deviation:.1f}%, more than {100 * tolerance:.0f}%: "
+                         f"the group key puts too many images in the same groups.")
+    if deviation > tolerance:
+        print(f"Warning: the folds are unbalanced by more than {100 * tolerance:.0f}%.")
+    return deviation <= tolerance
+
+def divide_images_and_texts_into_groups(image_folder, output_folder, num_groups=5, mode='hardlink', num_threads=8,
+                                        group_key=None, dataset_index=None, balance_tolerance=0.1):
+    if mode not in MATERIALISE_MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MATERIALISE_MODES}.")
+    start_time = time.perf_counter()
+
+    # List all images in the folder, from the dataset index when given (which also leaves out unreadable images)
+    if dataset_index is not None:
+        images = dataset_index.image_files(image_folder)
+    else:
+        images = [f for f in os.listdir(image_folder) if is_image_file(f)]  # Filtra solo le immagini
+
+    # Keep the folds of previous runs, only new images are assigned (by the hash of their group key, e.g. their survey)
+    os.makedirs(output_folder, exist_ok=True)
+    assignments, previous_mode, previous_stamps = load_fold_manifest(output_folder, num_groups)
+    if not assignments and mode != 'list' and os.path.exists(os.path.join(output_folder, 'fold_1')):
+        raise ValueError(f"{output_folder} holds folds without a manifest, use a new output folder.")
+    current_images = set(images)
+    new_images = sorted(current_images - set(assignments))
+    removed_images = sorted(set(assignments) - current_images)
+    for image in new_images:
+        assignments[image] = assign_fold(group_key(image) if group_key else image, num_groups)
+    removed_folds = {image: assignments.pop(image) for image in removed_images}
+
+    # Hashed image names balance the folds up to chance, so the check is advisory for them. A group key can put whole
+    # surveys in one fold, so a skewed split is an error, raised before anything is written
+    check_fold_balance(assignments, num_groups, balance_tolerance, strict=group_key is not None)
+
+    # Images whose file or label was edited since the last run are placed again, all of them when the mode changed.
+    # Unchanged files keep their inode and mtime, so the ultralytics label cache of a split stays valid until its own
+    # images change (it is rebuilt for the whole split then, and in 'list' mode on every load, see MATERIALISE_MODES)
+    stamps = {image: file_stamp(image_folder, image) for image in assignments}
+    if mode != previous_mode:
+        placed_images = sorted(assignments)
+    else:
+        placed_images = sorted(image for image in assignments if stamps[image] != previous_stamps.get(image))
+
+    # (source, destination) pairs to link or copy and paths to delete, only for images that changed
+    transfers = []
+    deletions = []
     for fold_index in range(num_groups):
         fold_folder = os.path.join(output_folder, f'fold_{fold_index + 1}')
-        test_folder = os.path.join(fold_folder, 'test')
-        training_folder = os.path.join(fold_folder, 'training')
+
+        if mode == 'list':
+            # The fold trees of a previous mode would be stale, the training scripts read the list files instead
+            if previous_mode is not None and previous_mode != 'list':
+                for split in ('training', 'test'):
+                    shutil.rmtree(os.path.join(fold_folder, split), ignore_errors=True)
+
+            # ultralytics accepts .txt files of image paths and finds each label next to its image
+            os.makedirs(fold_folder, exist_ok=True)
+            split_files = {}
+            for split, in_split in (('training', lambda fold: fold != fold_index), ('test', lambda fold: fold == fold_index)):
+                split_files[split] = os.path.join(fold_folder, f'{split}.txt')
+                with open(split_files[split], 'w') as f:
+                    f.writelines(f"{os.path.abspath(os.path.join(image_folder, image))}\n"
+                                 for image, fold in sorted(assignments.items()) if in_split(fold))
+            write_fold_data_yaml(output_folder, fold_index, split_files['training'], split_files['test'])
+            continue
+
+        # The list files of a previous 'list' run take precedence over the fold trees in the training scripts
+        for split in ('training', 'test'):
+            deletions.append(os.path.join(fold_folder, f'{split}.txt'))
 
         # Create the test and training folders with images and labels subfolders
-        os.makedirs(os.path.join(test_folder, 'images'), exist_ok=True)
-        os.makedirs(os.path.join(test_folder, 'labels'), exist_ok=True)
-        os.makedirs(os.path.join(training_folder, 'images'), exist_ok=True)
-        os.makedirs(os.path.join(training_folder, 'labels'), exist_ok=True)
-
-        # Copy the current group to the test folder
-        test_group = groups[fold_index]
-        for image in test_group:
+        for split in ('training', 'test'):
+            os.makedirs(os.path.join(fold_folder, split, 'images'), exist_ok=True)
+            os.makedirs(os.path.join(fold_folder, split, 'labels'), exist_ok=True)
+
+        for image in placed_images + removed_images:
             image_name, image_ext = os.path.splitext(image)
-            shutil.copy(os.path.join(image_folder, image), os.path.join(test_folder, 'images', image))
-            
-            # Copy the corresponding .txt file if it exists
             txt_file = f"{image_name}.txt"
-            if os.path.exists(os.path.join(image_folder, txt_file)):
-                shutil.copy(os.path.join(image_folder, txt_file), os.path.join(test_folder, 'labels', txt_file))
-
-        # Copy the remaining groups to the training folder
-        for i in range(num_groups):
-            if i != fold_index:
-                training_group = groups[i]
-                for image in training_group:
-                    image_name, image_ext = os.path.splitext(image)
-                    shutil.copy(os.path.join(image_folder, image), os.path.join(training_folder, 'images', image))
-                    
-                    # Copy the corresponding .txt file if it exists
-                    txt_file = f"{image_name}.txt"
-                    if os.path.exists(os.path.join(image_folder, txt_file)):
-                        shutil.copy(os.path.join(image_folder, txt_file), os.path.join(training_folder, 'labels', txt_file))
+            if image in removed_folds:
+                split = 'test' if removed_folds[image] == fold_index else 'training'
+                deletions.append(os.path.join(fold_folder, split, 'images', image))
+                deletions.append(os.path.join(fold_folder, split, 'labels', txt_file))
+                continue
+
+            split = 'test' if assignments[image] == fold_index else 'training'
+            transfers.append((os.path.join(image_folder, image), os.path.join(fold_folder, split, 'images', image)))
+
+            # Link or copy the corresponding .txt file if it exists, a label deleted from the source is deleted too
+            if stamps[image][1] is not None:
+                transfers.append((os.path.join(image_folder, txt_file), os.path.join(fold_folder, split, 'labels', txt_file)))
+            else:
+                deletions.append(os.path.join(fold_folder, split, 'labels', txt_file))
+        write_fold_data_yaml(output_folder, fold_index, os.path.join(fold_folder, 'training', 'images'),
+                             os.path.join(fold_folder, 'test', 'images'))
+
+    for path in deletions:
+        if os.path.lexists(path):
+            os.remove(path)
+
+    # The transfers are I/O bound, so they run on a thread pool
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        bytes_written = sum(executor.map(lambda transfer: materialise_file(*transfer, mode), transfers))
+    save_fold_manifest(output_folder, num_groups, assignments, mode, stamps)
 
+    elapsed_time = time.perf_counter() - start_time
     print(f'Division completed. The images and corresponding .txt files have been divided into {num_groups} groups and organized into fold directories.')
+    print(f"{len(new_images)} new and {len(removed_images)} removed images, {len(assignments)} images in total")
+    if mode != 'list' and previous_mode is not None and mode != previous_mode:
+        print(f"Mode changed from '{previous_mode}' to '{mode}', every image was placed again")
+    if mode == 'list':
+        print(f"Mode 'list': {2 * num_groups} image-list files written in {elapsed_time:.2f} s, no images copied")
+        print("All the splits share the label cache of the source folder, which is rescanned every time a fold "
+              "split is loaded; use 'hardlink' to give each split its own cache.")
+    else:
+        print(f"Mode '{mode}': {len(transfers)} files placed, {bytes_written / 1e6:.1f} MB written in {elapsed_time:.2f} s")
 
-# Example usage
-image_folder = r'path/to/your/image_folder'
-output_folder = r'path/to/your/output_folder'
-divide_images_and_texts_into_groups(image_folder, output_folder)
+if __name__ == '__main__':
+    # Example usage
+    image_folder = r'path/to/your/image_folder'
+    output_folder = r'path/to/your/output_folder'
+    divide_images_and_texts_into_groups(image_folder, output_folder, mode='hardlink')
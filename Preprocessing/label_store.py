@@ -0,0 +1,147 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Folder of the store files, kept inside the labels folder
+STORE_FOLDER = '.label_store'
+
+# Function to parse a YOLO label file into an (N, 5) float32 array of class, x_center, y_center, width, height.
+# Malformed lines are skipped with a warning, so one bad line does not stop the store from being built
+def parse_label_file(file_path):
+    rows = []
+    with open(file_path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = [float(value) for value in line.split()[:5]]
+            except ValueError:
+                row = None
+            if row is None or len(row) < 5:
+                print(f"Warning: skipping malformed line {line_number} of {file_path}: {line.strip()!r}")
+                continue
+            rows.append(row)
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+# All YOLO labels of a folder packed in one memory-mapped array, with per-image offsets
+class LabelStore:
+    def __init__(self, labels_folder, store_dir=None, num_threads=8):
+        self.labels_folder = labels_folder
+        self.store_dir = store_dir or os.path.join(labels_folder, STORE_FOLDER)
+        self.num_threads = num_threads
+
+        # boxes[offsets[i]:offsets[i + 1]] are the labels of names[i], read when the file had sizes[i] and mtimes[i]
+        self._names = np.zeros(0, dtype=str)
+        self._sizes = np.zeros(0, dtype=np.int64)
+        self._mtimes = np.zeros(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._boxes = np.zeros((0, 5), dtype=np.float32)
+        self._load()
+        self.refresh()
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, f'{name}.npy')
+
+    def _load(self):
+        if not os.path.exists(self._path('names')):
+            return
+        names = np.load(self._path('names'))
+        sizes = np.load(self._path('sizes'))
+        mtimes = np.load(self._path('mtimes'))
+        offsets = np.load(self._path('offsets'))
+        boxes = np.load(self._path('boxes'), mmap_mode='r')
+
+        # An interrupted save leaves files of mismatched lengths, in which case the store is rebuilt
+        if not (len(names) == len(sizes) == len(mtimes) == len(offsets) - 1) or offsets[-1] != len(boxes):
+            print(f"Label store in {self.store_dir} is inconsistent and will be rebuilt.")
+            return
+        self._names, self._sizes, self._mtimes, self._offsets, self._boxes = names, sizes, mtimes, offsets, boxes
+
+    def _index_names(self):
+        self._index = {os.path.splitext(name)[0]: i for i, name in enumerate(self._names)}
+
+    # Function to re-read only the label files added or modified since the last refresh
+    def refresh(self):
+        start_time = time.perf_counter()
+        with os.scandir(self.labels_folder) as entries:
+            files = sorted((entry.name, entry.stat()) for entry in entries
+                           if entry.name.endswith('.txt') and entry.is_file())
+        names = np.array([name for name, _ in files], dtype=str)
+        sizes = np.array([stat.st_size for _, stat in files], dtype=np.int64)
+        mtimes = np.array([stat.st_mtime_ns for _, stat in files], dtype=np.int64)
+
+        previous = {name: i for i, name in enumerate(self._names)}
+        previous_indices = np.array([previous.get(name, -1) for name in names], dtype=np.int64)
+        known = previous_indices >= 0
+        unchanged = known.copy()
+        unchanged[known] = ((self._sizes[previous_indices[known]] == sizes[known]) &
+                            (self._mtimes[previous_indices[known]] == mtimes[known]))
+        if unchanged.all() and len(names) == len(self._names):
+            self._index_names()
+            return
+
+        # Parse the changed files on a thread pool, the unchanged ones are sliced from the current store
+        changed = np.flatnonzero(~unchanged)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            parsed = dict(zip(changed, executor.map(parse_label_file,
+                                                    [os.path.join(self.labels_folder, names[i]) for i in changed])))
+        chunks = []
+        for i, previous_index in enumerate(previous_indices):
+            if unchanged[i]:
+                chunks.append(self._boxes[self._offsets[previous_index]:self._offsets[previous_index + 1]])
+            else:
+                chunks.append(parsed[i])
+        boxes = np.concatenate(chunks + [np.zeros((0, 5), dtype=np.float32)]).astype(np.float32)
+        offsets = np.concatenate([[0], np.cumsum([len(chunk) for chunk in chunks], dtype=np.int64)])
+
+        # Release the memory map before its file is replaced, boxes and offsets go before the names checked in _load
+        self._boxes = boxes
+        os.makedirs(self.store_dir, exist_ok=True)
+        for name, array in (('boxes', boxes), ('offsets', offsets), ('sizes', sizes), ('mtimes', mtimes), ('names', names)):
+            temporary_path = os.path.join(self.store_dir, f'{name}.tmp.npy')
+            np.save(temporary_path, array)
+            os.replace(temporary_path, self._path(name))
+
+        self._names, self._sizes, self._mtimes, self._offsets = names, sizes, mtimes, offsets
+        self._boxes = np.load(self._path('boxes'), mmap_mode='r')
+        self._index_names()
+        print(f"Label store refreshed: {len(changed)} of {len(names)} label files read in "
+              f"{time.perf_counter() - start_time:.2f} s")
+
+    def __len__(self):
+        return len(self._names)
+
+    # Function to get the labels of an image (by file name or stem), or None when it has no label file
+    def boxes(self, image_name):
+        index = self._index.get(os.path.splitext(image_name)[0])
+        if index is None:
+            return None
+        return np.asarray(self._boxes[self._offsets[index]:self._offsets[index + 1]])
+
+    # Function to get the ground truth box count of an image, or None when it has no label file
+    def box_count(self, image_name):
+        index = self._index.get(os.path.splitext(image_name)[0])
+        if index is None:
+            return None
+        return int(self._offsets[index + 1] - self._offsets[index])
+
+    # Function to get the number of boxes of every label file, in name order
+    def boxes_per_image(self):
+        return dict(zip(self._names.tolist(), np.diff(self._offsets).tolist()))
+
+    # Function to compute the count, mean area and area histogram of the boxes of every class
+    def class_area_stats(self, bins=20):
+        boxes = np.asarray(self._boxes)
+        classes = boxes[:, 0].astype(np.int64)
+        areas = boxes[:, 3] * boxes[:, 4]
+        counts = np.bincount(classes)
+        area_sums = np.bincount(classes, weights=areas)
+
+        stats = {}
+        for cls in np.flatnonzero(counts):
+            histogram, edges = np.histogram(areas[classes == cls], bins=bins)
+            stats[int(cls)] = {'count': int(counts[cls]), 'mean_area': float(area_sums[cls] / counts[cls]),
+                               'histogram': histogram, 'bin_edges': edges}
+        return stats
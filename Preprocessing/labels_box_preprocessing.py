@@ -1,20 +1,69 @@
+import hashlib
 import json
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-# Function to replace all labels with 'fish'
-def replace_all_labels_with_fish(json_file, new_label):
-    # Read the JSON file
-    with open(json_file, 'r') as file:
-        data = json.load(file)
-    
-    # Replace all labels with new_label
-    for shape in data.get('shapes', []):
-        shape['label'] = new_label
-    
-    # Save the modified JSON file
-    with open(json_file, 'w') as file:
-        json.dump(data, file, indent=4)
+# orjson parses and serialises several times faster than json when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Version of the conversion below, bump it when the output changes so every file is converted again
+TRANSFORM_VERSION = 1
+
+# Manifest of the converted files, kept at the root of the converted tree
+MANIFEST_FILE = 'labelme_manifest.json'
+
+# Function to read a JSON file
+def load_json(json_file):
+    with open(json_file, 'rb') as file:
+        content = file.read()
+    return orjson.loads(content) if orjson else json.loads(content)
+
+# Function to write a JSON file, returning the bytes written
+def save_json(data, json_file):
+    content = orjson.dumps(data, option=orjson.OPT_INDENT_2) if orjson else json.dumps(data, indent=4).encode()
+    with open(json_file, 'wb') as file:
+        file.write(content)
+    return content
+
+# Function to describe a file as stored in the manifest
+def manifest_record(json_file, content, transform_key):
+    stat = os.stat(json_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': hashlib.sha1(content).hexdigest(),
+            'transform': transform_key}
+
+# Function to list the JSON files of a tree with their size and mtime, and whether their .txt label exists
+def scan_json_files(json_dir):
+    folders = [json_dir]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            entries = list(entries)
+        names = {entry.name for entry in entries}
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry.path)
+            elif entry.name.endswith('.json') and entry.name != MANIFEST_FILE:
+                stat = entry.stat()
+                has_label = f"{os.path.splitext(entry.name)[0]}.txt" in names
+                yield entry.path, stat.st_size, stat.st_mtime_ns, has_label
+
+# Function to load the manifest of a tree, {relative path: record}
+def load_manifest(json_dir):
+    manifest_path = os.path.join(json_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    return load_json(manifest_path)
+
+# Function to save the manifest of a tree atomically
+def save_manifest(json_dir, manifest):
+    manifest_path = os.path.join(json_dir, MANIFEST_FILE)
+    save_json(manifest, f'{manifest_path}.tmp')
+    os.replace(f'{manifest_path}.tmp', manifest_path)
 
 # Function to convert points to bounding boxes of size 20x20
 def point_to_bbox(point, img_width, img_height, box_width=20, box_height=20):
@@ -35,73 +84,127 @@ def point_to_bbox(point, img_width, img_height, box_width=20, box_height=20):
         "y_max": y_max / img_height
     }
 
-# Function to replace points with bounding boxes in the JSON
-def replace_points_with_bboxes(json_file, box_width=20, box_height=20):
-    with open(json_file, 'r') as file:
-        data = json.load(file)
-    
-    new_shapes = []
-    
-    for shape in data.get('shapes', []):
-        if shape['shape_type'] == 'point':
-            # Convert the point to a bounding box of size 20x20
-            bbox = point_to_bbox(shape['points'][0], data['imageWidth'], data['imageHeight'], box_width, box_height)
-            new_shapes.append({
-                "label": shape['label'],
-                "shape_type": "rectangle",
-                "points": [
-                    [bbox['x_min'], bbox['y_min']],
-                    [bbox['x_max'], bbox['y_max']]
-                ]
-            })
-        else:
-            # Keep existing rectangles
+# Function to convert the points of a shape into a YOLO line (class x_center y_center width height)
+def shape_to_yolo_line(points, img_width, img_height, class_id=0):
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+
+    # Converted points are already normalised, rectangles drawn in LabelMe are in pixels
+    if max(xs + ys) > 1:
+        xs = [x / img_width for x in xs]
+        ys = [y / img_height for y in ys]
+    x_min, x_max = max(0.0, min(xs)), min(1.0, max(xs))
+    y_min, y_max = max(0.0, min(ys)), min(1.0, max(ys))
+    if x_max <= x_min or y_max <= y_min:
+        return None
+    return (f"{class_id} {(x_min + x_max) / 2:.6f} {(y_min + y_max) / 2:.6f} "
+            f"{x_max - x_min:.6f} {y_max - y_min:.6f}")
+
+# Function to relabel every shape, replace points with bounding boxes and write the YOLO .txt in a single pass.
+# Returns (json_file, box count, error, manifest record, skipped)
+def convert_labelme_file(json_file, previous_sha1=None, new_label='fish', box_width=20, box_height=20, class_id=0):
+    transform_key = f"{TRANSFORM_VERSION}:{new_label}:{box_width}x{box_height}"
+    try:
+        with open(json_file, 'rb') as file:
+            content = file.read()
+
+        # A file touched without edits is recognised by its hash and not converted again
+        if previous_sha1 is not None and hashlib.sha1(content).hexdigest() == previous_sha1:
+            return json_file, 0, None, manifest_record(json_file, content, transform_key), True
+
+        data = orjson.loads(content) if orjson else json.loads(content)
+        img_width, img_height = data['imageWidth'], data['imageHeight']
+
+        new_shapes = []
+        yolo_lines = []
+        for shape in data.get('shapes', []):
+            # Replace the label with new_label
+            shape['label'] = new_label
+
+            if shape['shape_type'] == 'point':
+                # Convert the point to a bounding box of size 20x20
+                bbox = point_to_bbox(shape['points'][0], img_width, img_height, box_width, box_height)
+                shape = {
+                    "label": new_label,
+                    "shape_type": "rectangle",
+                    "points": [
+                        [bbox['x_min'], bbox['y_min']],
+                        [bbox['x_max'], bbox['y_max']]
+                    ]
+                }
             new_shapes.append(shape)
-    
-    # Update the shapes in the JSON
-    data['shapes'] = new_shapes
-    
-    # Save the modified JSON file
-    with open(json_file, 'w') as file:
-        json.dump(data, file, indent=4)
-
-# Automatically get the directory where this script is located
-json_dir = os.path.dirname(os.path.realpath(__file__))
-
-# New label to replace all others
-new_label = 'fish'
-
-# Track the start time
-start_time = time.time()
-
-# Walk through all directories and subdirectories
-for root, dirs, files in os.walk(json_dir):
-    for i, filename in enumerate(files, 1):
-        if filename.endswith('.json'):
-            json_file = os.path.join(root, filename)
-            
-            try:
-                # Print the current directory and file being processed
-                print(f"Processing file: {filename} in directory: {root}")
-                
-                # First, replace all labels with 'fish'
-                replace_all_labels_with_fish(json_file, new_label)
-            
-                # Then, replace points with 20x20 bounding boxes
-                replace_points_with_bboxes(json_file, box_width=20, box_height=20)
-            
-                # Print the time elapsed for each file
-                current_time = time.time()
-                elapsed_time = current_time - start_time
-                print(f"Processed {i} files. Time elapsed: {elapsed_time:.2f} seconds")
-            
-            except Exception as e:
-                # Handle any errors that occur and continue with the next file
-                print(f"Error processing file {filename} in directory {root}: {e}")
-
-# Calculate total execution time
-end_time = time.time()
-total_time = end_time - start_time
-
-# Print the total execution time
-print(f"Total execution time: {total_time:.2f} seconds")
+
+            yolo_line = shape_to_yolo_line(shape['points'], img_width, img_height, class_id)
+            if yolo_line is not None:
+                yolo_lines.append(yolo_line)
+
+        # Save the modified JSON file and the YOLO label next to it
+        data['shapes'] = new_shapes
+        content = save_json(data, json_file)
+        with open(f"{os.path.splitext(json_file)[0]}.txt", 'w') as file:
+            file.write(''.join(f"{line}\n" for line in yolo_lines))
+        return json_file, len(yolo_lines), None, manifest_record(json_file, content, transform_key), False
+    except Exception as e:
+        return json_file, 0, str(e), None, False
+
+# Function to convert the new or edited LabelMe JSON files of a tree on a process pool
+def convert_labelme_tree(json_dir, new_label='fish', box_width=20, box_height=20, workers=None, chunksize=64):
+    # Track the start time
+    start_time = time.time()
+    transform_key = f"{TRANSFORM_VERSION}:{new_label}:{box_width}x{box_height}"
+    manifest = load_manifest(json_dir)
+
+    # Stat-only fast path: files with the size, mtime and transform of the manifest and a label are up to date
+    json_files, previous_hashes = [], []
+    seen = set()
+    for json_file, size, mtime_ns, has_label in scan_json_files(json_dir):
+        relative_path = os.path.relpath(json_file, json_dir)
+        seen.add(relative_path)
+        record = manifest.get(relative_path)
+        if record is not None and record['transform'] == transform_key and has_label:
+            if record['size'] == size and record['mtime_ns'] == mtime_ns:
+                continue
+            previous_hashes.append(record['sha1'])
+        else:
+            previous_hashes.append(None)
+        json_files.append(json_file)
+
+    # Forget the files that were deleted
+    for relative_path in set(manifest) - seen:
+        del manifest[relative_path]
+
+    converted = partial(convert_labelme_file, new_label=new_label, box_width=box_width, box_height=box_height)
+    file_count = box_count = error_count = skipped_count = 0
+    if json_files:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for json_file, file_boxes, error, record, skipped in executor.map(converted, json_files, previous_hashes,
+                                                                              chunksize=chunksize):
+                if error is not None:
+                    # Report the error and continue with the next file
+                    error_count += 1
+                    print(f"Error processing file {json_file}: {error}")
+                    continue
+                manifest[os.path.relpath(json_file, json_dir)] = record
+                if skipped:
+                    skipped_count += 1
+                    continue
+                file_count += 1
+                box_count += file_boxes
+    save_manifest(json_dir, manifest)
+
+    # Print the throughput summary
+    total_time = time.time() - start_time
+    up_to_date = len(seen) - len(json_files) + skipped_count
+    print(f"Converted {file_count} files ({box_count} boxes, {error_count} errors) in {total_time:.2f} seconds "
+          f"({file_count / max(total_time, 1e-9):.1f} files/s, JSON parser: {'orjson' if orjson else 'json'}), "
+          f"{up_to_date} files already up to date")
+
+if __name__ == '__main__':
+    # Automatically get the directory where this script is located
+    json_dir = os.path.dirname(os.path.realpath(__file__))
+
+    # New label to replace all others
+    new_label = 'fish'
+
+    # Convert the tree with 20x20 bounding boxes around the points
+    convert_labelme_tree(json_dir, new_label, box_width=20, box_height=20)
@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from dataset_files import is_image_file
+
+# File mapping every image to the kept image it duplicates (itself when kept), kept in the image folder
+CLUSTERS_FILE = 'near_duplicate_clusters.json'
+
+# File mapping every image to its fold group, the first image of a capped chain of near-duplicates
+GROUPS_FILE = 'near_duplicate_groups.json'
+
+# Number of set bits of every byte value, used when numpy has no bitwise_count
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+# Function to compute the 64-bit difference hash of an image, or None when it cannot be read
+def dhash(image_path, hash_size=8):
+    # A reduced-size decode is enough for a 9x8 thumbnail and much faster than a full decode
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+    thumbnail = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = thumbnail[:, 1:] > thumbnail[:, :-1]
+    return int(np.packbits(bits.ravel()).view('>u8')[0])
+
+# Function to hash the images of a folder on a thread pool, returning the hashed names and their uint64 hashes
+def hash_images(folder_path, image_files, num_threads=8):
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        hashes = list(executor.map(dhash, [os.path.join(folder_path, f) for f in image_files]))
+    hashed = [(image_file, value) for image_file, value in zip(image_files, hashes) if value is not None]
+    return [image_file for image_file, _ in hashed], np.array([value for _, value in hashed], dtype=np.uint64)
+
+# Function to count the differing bits between rows of hashes and all hashes
+def hamming_distances(row_hashes, hashes):
+    xor = row_hashes[:, None] ^ hashes[None, :]
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor)
+    return _BYTE_POPCOUNT[xor.view(np.uint8)].reshape(*xor.shape, 8).sum(axis=-1)
+
+# Function to find all pairs of hashes within 'max_distance' bits, comparing a block of rows at a time
+def near_duplicate_pairs(hashes, max_distance=6, max_block_elements=1 << 24):
+    pairs = []
+    block_size = max(1, max_block_elements // max(1, len(hashes)))
+    for start in range(0, len(hashes), block_size):
+        distances = hamming_distances(hashes[start:start + block_size], hashes)
+        rows, columns = np.nonzero(distances <= max_distance)
+        rows += start
+        upper = columns > rows
+        pairs.append(np.column_stack([rows[upper], columns[upper]]))
+    return np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+
+# Function to pick representatives greedily in name order from the near-duplicate pairs: an image is dropped only
+# when it is within the pairs' distance of an image already kept, so every dropped frame has a kept one that looks the same
+def greedy_representatives(num_images, pairs):
+    representatives = np.arange(num_images)
+    # Pairs are (smaller, larger) indices; sorted by the larger one, every smaller image is decided before it is used
+    for a, b in pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]:
+        if representatives[a] == a and representatives[b] == b:
+            representatives[b] = a
+    return representatives
+
+# Function to group the images linked by near-duplicate pairs with union-find, returning the group root of each image.
+# Chains (e.g. a slow pan) are cut at 'max_group_size' images so a survey never collapses into one group.
+def cluster_pairs(num_images, pairs, max_group_size=None):
+    parents = np.arange(num_images)
+    sizes = np.ones(num_images, dtype=np.int64)
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a == root_b or (max_group_size and sizes[root_a] + sizes[root_b] > max_group_size):
+            continue
+        # The smaller index (first name in sorted order) stays the root
+        root, child = min(root_a, root_b), max(root_a, root_b)
+        parents[child] = root
+        sizes[root] += sizes[child]
+    return np.array([find(i) for i in range(num_images)])
+
+# Function to find the near-duplicates of a folder: {image: kept image} for deduplication, saved with the fold groups
+def find_near_duplicates(folder_path, max_distance=6, group_distance=4, max_group_size=50, num_threads=8):
+    start_time = time.time()
+    image_files = sorted(f for f in os.listdir(folder_path) if is_image_file(f))
+    names, hashes = hash_images(folder_path, image_files, num_threads)
+
+    representatives = greedy_representatives(len(names), near_duplicate_pairs(hashes, max_distance))
+    clusters = {name: names[representative] for name, representative in zip(names, representatives)}
+    with open(os.path.join(folder_path, CLUSTERS_FILE), 'w') as f:
+        json.dump(clusters, f, indent=1)
+
+    # Fold groups use a tighter threshold and a size cap, only to keep near-identical frames out of different folds
+    roots = cluster_pairs(len(names), near_duplicate_pairs(hashes, group_distance), max_group_size)
+    with open(os.path.join(folder_path, GROUPS_FILE), 'w') as f:
+        json.dump({name: names[root] for name, root in zip(names, roots)}, f, indent=1)
+
+    kept_count = len(set(representatives.tolist()))
+    print(f"Hashed {len(names)} images in {time.time() - start_time:.2f} seconds: {kept_count} kept, "
+          f"{len(names) - kept_count} near-duplicates (Hamming distance <= {max_distance}), "
+          f"{len(set(roots.tolist()))} fold groups")
+    return clusters
+
+# Function to keep the representative images and move their near-duplicates, with their labels, to a removed folder
+def remove_near_duplicates(folder_path, clusters, removed_folder=None):
+    removed_folder = removed_folder or os.path.join(folder_path, 'removed_duplicates')
+    os.makedirs(removed_folder, exist_ok=True)
+    removed = 0
+    for image_file, representative in clusters.items():
+        if image_file == representative:
+            continue
+        shutil.move(os.path.join(folder_path, image_file), os.path.join(removed_folder, image_file))
+        label_file = f"{os.path.splitext(image_file)[0]}.txt"
+        if os.path.exists(os.path.join(folder_path, label_file)):
+            shutil.move(os.path.join(folder_path, label_file), os.path.join(removed_folder, label_file))
+        removed += 1
+
+    # The kept images are their own clusters from now on
+    kept = {image_file: image_file for image_file, representative in clusters.items() if image_file == representative}
+    with open(os.path.join(folder_path, CLUSTERS_FILE), 'w') as f:
+        json.dump(kept, f, indent=1)
+    print(f"Removed {removed} near-duplicate images, {len(kept)} kept. Moved to: {removed_folder}")
+    return removed
+
+# Function to build a k_fold_division group_key that keeps every near-duplicate group inside a single fold
+def cluster_group_key(folder_path):
+    with open(os.path.join(folder_path, GROUPS_FILE), 'r') as f:
+        groups = json.load(f)
+    return lambda image_file: groups.get(image_file, image_file)
+
+if __name__ == '__main__':
+    # Folder with the images and their .txt labels (the input of k_fold_division)
+    image_folder = r'path/to/your/image_folder'
+
+    # Largest number of differing hash bits between a frame and a kept frame for it to count as a duplicate
+    max_distance = 6
+
+    # Tighter distance and size cap of the groups kept together in one fold
+    group_distance = 4
+    max_group_size = 50
+
+    # Move the near-duplicates out of the dataset, or only record the clusters for fold division
+    deduplicate = False
+
+    clusters = find_near_duplicates(image_folder, max_distance, group_distance, max_group_size)
+    if deduplicate:
+        remove_near_duplicates(image_folder, clusters)
+
+    # To keep clusters within one fold: divide_images_and_texts_into_groups(..., group_key=cluster_group_key(image_folder))
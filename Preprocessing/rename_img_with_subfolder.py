@@ -1,39 +1,133 @@
+import json
 import os
+import time
 
-def add_suffix_to_files_in_folder(folder_path, chosen_suffix, suffix=""):
-    try:
-        # Iterate over all the files and directories in the current folder
-        for filename in os.listdir(folder_path):
-            # Get the full path of the file or directory
-            full_path = os.path.join(folder_path, filename)
-            
-            # If it's a directory, call the function recursively
-            if os.path.isdir(full_path):
-                # Add the subfolder name to the suffix
-                new_suffix = f"{suffix}_{filename}" if suffix else filename
-                add_suffix_to_files_in_folder(full_path, chosen_suffix, new_suffix)
-            
-            # If it's a file, rename it
-            elif os.path.isfile(full_path):
-                # Split the filename into name and extension
-                name, ext = os.path.splitext(filename)
-                
-                # Create the new filename with the chosen suffix and subfolder names
-                new_filename = f"{name}_{chosen_suffix}{suffix}{ext}"
-                
-                # Get the full path for the new filename
-                new_full_path = os.path.join(folder_path, new_filename)
-                
-                # Rename the file
-                os.rename(full_path, new_full_path)
-                print(f"Renamed: {filename} -> {new_filename}")
-                
-        print(f"Renaming completed in folder: {folder_path}")
-        
-    except Exception as e:
-        print(f"Error: {e}")
-
-# Example usage
-folder_path = os.getcwd()  # Automatically detect the current folder
-chosen_suffix = "ciao"  # Choose the suffix to add
-add_suffix_to_files_in_folder(folder_path, chosen_suffix)
+# Journal of a rename run, kept in the renamed folder until the run completes
+JOURNAL_FILE = 'rename_journal.jsonl'
+
+# Folders holding the images and labels of the same samples, left out of the suffix so pairs keep matching names
+PAIR_FOLDERS = ('images', 'labels')
+
+# Function to walk the tree once and compute the new name of every file, returning (source, target) pairs
+def plan_renames(folder_path, chosen_suffix, suffix="", pair_folders=PAIR_FOLDERS):
+    plan = []
+    folders = [(folder_path, suffix)]
+    while folders:
+        folder, folder_suffix = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                # If it's a directory, add the subfolder name to the suffix
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in pair_folders:
+                        new_suffix = folder_suffix
+                    else:
+                        new_suffix = f"{folder_suffix}_{entry.name}" if folder_suffix else entry.name
+                    folders.append((entry.path, new_suffix))
+
+                # If it's a file, create the new filename with the chosen suffix and subfolder names
+                elif entry.is_file() and entry.name != JOURNAL_FILE:
+                    name, ext = os.path.splitext(entry.name)
+                    new_filename = f"{name}_{chosen_suffix}{folder_suffix}{ext}"
+                    plan.append((entry.path, os.path.join(folder, new_filename)))
+    plan.sort()
+    return plan
+
+# Function to find the targets claimed by several files or already taken by an existing file
+def find_collisions(plan):
+    sources = {source for source, _ in plan}
+    seen = set()
+    collisions = []
+    for source, target in plan:
+        if target in seen or (os.path.exists(target) and target not in sources) or target in sources:
+            collisions.append((source, target))
+        seen.add(target)
+    return collisions
+
+# Function to read a journal, returning its header, the planned renames and the indices already done
+def read_journal(journal_path):
+    plan, done = [], set()
+    with open(journal_path, 'r') as journal:
+        header = json.loads(journal.readline())
+        for line in journal:
+            if not line.endswith('\n'):
+                # Line cut by an interruption
+                break
+            record = json.loads(line)
+            if 'done' in record:
+                done.add(record['done'])
+            else:
+                plan.append((record['source'], record['target']))
+    return header, plan, done
+
+# Function to apply the pending renames of a journal, recording each one, then remove the journal
+def execute_journal(journal_path, flush_every=1000):
+    header, plan, done = read_journal(journal_path)
+    start_time = time.time()
+    renamed = 0
+    with open(journal_path, 'a') as journal:
+        for index, (source, target) in enumerate(plan):
+            if index in done:
+                continue
+            # A rename done just before an interruption was not recorded, the target already exists
+            if os.path.exists(source):
+                os.rename(source, target)
+                renamed += 1
+            journal.write(json.dumps({'done': index}) + '\n')
+            if index % flush_every == 0:
+                journal.flush()
+    os.remove(journal_path)
+    print(f"Renamed {renamed} files ({len(plan)} planned) in {time.time() - start_time:.2f} seconds")
+
+# Function to add the chosen suffix and the subfolder names to every file of a tree, through a journal
+def add_suffix_to_files_in_folder(folder_path, chosen_suffix, suffix="", dry_run=False, pair_folders=PAIR_FOLDERS):
+    journal_path = os.path.join(folder_path, JOURNAL_FILE)
+    if os.path.exists(journal_path):
+        print(f"An interrupted run was found, use resume_renames or rollback_renames on {folder_path}.")
+        return
+
+    # Phase 1: plan all renames and check them before touching any file
+    plan = plan_renames(folder_path, chosen_suffix, suffix, pair_folders)
+    collisions = find_collisions(plan)
+    if collisions:
+        print(f"Renaming aborted, {len(collisions)} target names collide:")
+        for source, target in collisions[:20]:
+            print(f"  {source} -> {target}")
+        return
+    if dry_run:
+        for source, target in plan[:20]:
+            print(f"Would rename: {os.path.relpath(source, folder_path)} -> {os.path.basename(target)}")
+        print(f"Dry run: {len(plan)} files would be renamed in folder: {folder_path}")
+        return
+
+    # Phase 2: write the whole plan to the journal, then rename
+    with open(journal_path, 'w') as journal:
+        journal.write(json.dumps({'folder_path': folder_path, 'chosen_suffix': chosen_suffix}) + '\n')
+        journal.writelines(json.dumps({'source': source, 'target': target}) + '\n' for source, target in plan)
+        journal.flush()
+        os.fsync(journal.fileno())
+    execute_journal(journal_path)
+    print(f"Renaming completed in folder: {folder_path}")
+
+# Function to finish an interrupted run from its journal
+def resume_renames(folder_path):
+    execute_journal(os.path.join(folder_path, JOURNAL_FILE))
+
+# Function to undo the renames recorded in the journal of an interrupted run
+def rollback_renames(folder_path):
+    journal_path = os.path.join(folder_path, JOURNAL_FILE)
+    _, plan, _ = read_journal(journal_path)
+    restored = 0
+    for source, target in reversed(plan):
+        # Renames done without being recorded are found by their target existing
+        if os.path.exists(target) and not os.path.exists(source):
+            os.rename(target, source)
+            restored += 1
+    os.remove(journal_path)
+    print(f"Rolled back {restored} renames in folder: {folder_path}")
+
+if __name__ == '__main__':
+    # Example usage
+    folder_path = os.getcwd()  # Automatically detect the current folder
+    chosen_suffix = "ciao"  # Choose the suffix to add
+    dry_run = False  # Only print the planned renames
+    add_suffix_to_files_in_folder(folder_path, chosen_suffix, dry_run=dry_run)
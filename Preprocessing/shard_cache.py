@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from dataset_files import is_image_file, label_path_for
+
+# Index of a shard folder, listing every image with its shard, row and sizes
+SHARD_INDEX_FILE = 'index.json'
+
+# Function to read a YOLO label file into an (N, 5) float32 array of class, x_center, y_center, width, height
+def read_labels(label_path):
+    if label_path is None:
+        return np.zeros((0, 5), dtype=np.float32)
+    with open(label_path, 'r') as f:
+        rows = [line.split()[:5] for line in f if line.strip()]
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+# Function to decode an image and resize its long side to imgsz, the same way the ultralytics loader does
+def load_resized(image_path, imgsz=640):
+    image = cv2.imread(image_path)
+    if image is None:
+        return None, None
+    h0, w0 = image.shape[:2]
+    ratio = imgsz / max(h0, w0)
+    if ratio != 1:
+        width, height = min(math.ceil(w0 * ratio), imgsz), min(math.ceil(h0 * ratio), imgsz)
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+    return image, (h0, w0)
+
+# Function to write images into memory-mapped shards of top-left letterboxed imgsz x imgsz slots, with label shards
+def build_shards(image_paths, shard_dir, imgsz=640, shard_size=1000, num_threads=8, pad_value=114):
+    start_time = time.perf_counter()
+    os.makedirs(shard_dir, exist_ok=True)
+    entries = []
+    for shard, start in enumerate(range(0, len(image_paths), shard_size)):
+        shard_paths = image_paths[start:start + shard_size]
+        images = np.lib.format.open_memmap(os.path.join(shard_dir, f'images_{shard:04d}.npy'), mode='w+',
+                                           dtype=np.uint8, shape=(len(shard_paths), imgsz, imgsz, 3))
+
+        # Decode and resize on a thread pool, the content goes in the top-left corner so labels need no offset
+        labels, row = [], 0
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            for image_path, (image, original_size) in zip(shard_paths, executor.map(lambda p: load_resized(p, imgsz), shard_paths)):
+                if image is None:
+                    print(f"Failed to read image: {image_path}")
+                    continue
+                height, width = image.shape[:2]
+                images[row] = pad_value
+                images[row, :height, :width] = image
+                labels.append(read_labels(label_path_for(image_path)))
+                entries.append({'name': os.path.basename(image_path), 'path': os.path.abspath(image_path),
+                                'shard': shard, 'row': row, 'h0': original_size[0], 'w0': original_size[1],
+                                'h': height, 'w': width})
+                row += 1
+        images.flush()
+        del images
+
+        # Labels stay normalised to the original image, which is also the resized content of the slot
+        np.save(os.path.join(shard_dir, f'labels_{shard:04d}.npy'),
+                np.concatenate(labels + [np.zeros((0, 5), dtype=np.float32)]))
+        np.save(os.path.join(shard_dir, f'label_offsets_{shard:04d}.npy'),
+                np.concatenate([[0], np.cumsum([len(label) for label in labels], dtype=np.int64)]))
+
+    # The index is written last, so a shard folder without one is incomplete
+    with open(os.path.join(shard_dir, SHARD_INDEX_FILE), 'w') as f:
+        json.dump({'imgsz': imgsz, 'shard_size': shard_size, 'images': entries}, f)
+
+    elapsed_time = time.perf_counter() - start_time
+    print(f"Wrote {len(entries)} images to {shard_dir} in {elapsed_time:.2f} s "
+          f"({len(entries) / max(elapsed_time, 1e-9):.1f} images/s)")
+
+# Function to build the shards of a fold split from its image-list file or its images folder
+def build_fold_shards(dataset_path, fold, imgsz=640, shard_size=1000, num_threads=8):
+    for split in ('training', 'test'):
+        list_file = os.path.join(dataset_path, f'fold_{fold}', f'{split}.txt')
+        if os.path.exists(list_file):
+            with open(list_file, 'r') as f:
+                image_paths = [line.strip() for line in f if line.strip()]
+        else:
+            images_folder = os.path.join(dataset_path, f'fold_{fold}', split, 'images')
+            image_paths = [os.path.join(images_folder, f) for f in sorted(os.listdir(images_folder))
+                           if is_image_file(f)]
+        build_shards(image_paths, fold_shard_dir(dataset_path, fold, split), imgsz, shard_size, num_threads)
+
+# Function to get the shard folder of a fold split
+def fold_shard_dir(dataset_path, fold, split):
+    return os.path.join(dataset_path, f'fold_{fold}', 'shards', split)
+
+# Function to check whether a folder holds complete shards
+def has_shards(shard_dir):
+    return os.path.exists(os.path.join(shard_dir, SHARD_INDEX_FILE))
+
+# Read access to a shard folder: images are memory-mapped, so only the slots used are read from disk
+class ShardReader:
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, SHARD_INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        self.imgsz = index['imgsz']
+        self.entries = index['images']
+        shard_count = max((entry['shard'] for entry in self.entries), default=-1) + 1
+        self._images = [np.load(os.path.join(shard_dir, f'images_{shard:04d}.npy'), mmap_mode='r')
+                        for shard in range(shard_count)]
+        self._labels = [np.load(os.path.join(shard_dir, f'labels_{shard:04d}.npy')) for shard in range(shard_count)]
+        self._label_offsets = [np.load(os.path.join(shard_dir, f'label_offsets_{shard:04d}.npy'))
+                               for shard in range(shard_count)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Dataloader workers started with spawn receive the reader pickled, they re-open the memory maps instead of copying them
+    def __getstate__(self):
+        return {'shard_dir': self.shard_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['shard_dir'])
+
+    # Function to get the full letterboxed slot of an image (content top-left, padding right and bottom)
+    def letterboxed(self, i):
+        entry = self.entries[i]
+        return self._images[entry['shard']][entry['row']]
+
+    # Function to get the resized image without its padding
+    def image(self, i):
+        entry = self.entries[i]
+        return self._images[entry['shard']][entry['row'], :entry['h'], :entry['w']]
+
+    # Function to get the labels of an image, normalised to the image
+    def labels(self, i):
+        entry = self.entries[i]
+        offsets = self._label_offsets[entry['shard']]
+        return self._labels[entry['shard']][offsets[entry['row']]:offsets[entry['row'] + 1]]
+
+    # Function to yield (image file, resized image) pairs without the padding, as a drop-in source for the Test pipelines
+    # (normalised boxes then match the original image, pixel boxes are in the resized image)
+    def iter_images(self):
+        for i, entry in enumerate(self.entries):
+            yield entry['name'], np.ascontiguousarray(self.image(i))
+
+# Function to build an ultralytics dataset reading images and labels from a shard folder instead of the files
+def build_shard_dataset(cfg, shard_dir, batch, data, mode='train', rect=False, stride=32):
+    from ultralytics.data.dataset import YOLODataset
+    from ultralytics.utils import colorstr
+
+    class ShardYOLODataset(YOLODataset):
+        def get_img_files(self, img_path):
+            self.shards = ShardReader(img_path)
+            return [entry['path'] for entry in self.shards.entries]
+
+        def get_labels(self):
+            labels = []
+            for i, entry in enumerate(self.shards.entries):
+                shard_labels = self.shards.labels(i)
+                labels.append({
+                    'im_file': entry['path'],
+                    'shape': (entry['h0'], entry['w0']),
+                    'cls': shard_labels[:, 0:1].copy(),
+                    'bboxes': shard_labels[:, 1:5].copy(),
+                    'segments': [],
+                    'keypoints': None,
+                    'normalized': True,
+                    'bbox_format': 'xywh',
+                })
+            return labels
+
+        def load_image(self, i, rect_mode=True, resize_short=False):
+            if self.ims[i] is not None:
+                return self.ims[i], self.im_hw0[i], self.im_hw[i]
+            entry = self.shards.entries[i]
+            image = np.ascontiguousarray(self.shards.image(i))
+            if not rect_mode:
+                image = cv2.resize(image, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+            elif self.shards.imgsz != self.imgsz:
+                ratio = self.imgsz / max(image.shape[:2])
+                image = cv2.resize(image, (min(math.ceil(image.shape[1] * ratio), self.imgsz),
+                                           min(math.ceil(image.shape[0] * ratio), self.imgsz)),
+                                   interpolation=cv2.INTER_LINEAR)
+
+            # Same buffer of recent images as the file loader, used by mosaic
+            if self.augment:
+                self.ims[i], self.im_hw0[i], self.im_hw[i] = image, (entry['h0'], entry['w0']), image.shape[:2]
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    j = self.buffer.pop(0)
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+            return image, (entry['h0'], entry['w0']), image.shape[:2]
+
+    # The shards are already memory-mapped, so the image cache of ultralytics is disabled
+    return ShardYOLODataset(
+        img_path=shard_dir,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == 'train',
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=None,
+        single_cls=cfg.single_cls or False,
+        stride=stride,
+        pad=0.0 if mode == 'train' else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+    )
+
+# Function to get a DetectionTrainer class whose data YAML 'train'/'val' entries are shard folders
+def make_shard_trainer():
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils.torch_utils import unwrap_model
+
+    class ShardDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode='train', batch=None):
+            stride = max(int(unwrap_model(self.model).stride.max()), 32)
+            return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode, rect=mode == 'val', stride=stride)
+
+    return ShardDetectionTrainer
+
+# Function to get a DetectionValidator class reading its data YAML 'val' shard folder
+def make_shard_validator():
+    from ultralytics.models.yolo.detect import DetectionValidator
+
+    class ShardDetectionValidator(DetectionValidator):
+        def build_dataset(self, img_path, mode='val', batch=None):
+            return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode, stride=self.stride)
+
+    return ShardDetectionValidator
+
+# Function to compare the loading speed of the original files (decode and resize) with the shards
+def benchmark_loading(shard_dir, num_images=500):
+    reader = ShardReader(shard_dir)
+    indices = range(min(num_images, len(reader)))
+
+    start_time = time.perf_counter()
+    for i in indices:
+        load_resized(reader.entries[i]['path'], reader.imgsz)
+    file_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for i in indices:
+        np.ascontiguousarray(reader.image(i))
+    shard_time = time.perf_counter() - start_time
+
+    count = len(indices)
+    print(f"Files: {count / max(file_time, 1e-9):.1f} images/s, shards: {count / max(shard_time, 1e-9):.1f} images/s "
+          f"({file_time / max(shard_time, 1e-9):.1f}x faster)")
+    return file_time, shard_time
+
+if __name__ == '__main__':
+    # Dataset folder of the training scripts, holding the fold_k folders
+    dataset_path = os.path.join(os.getcwd(), "dataset")
+
+    # Build the shards of every fold and measure the loading speed-up on the first one
+    for fold in range(1, 6):
+        build_fold_shards(dataset_path, fold)
+    benchmark_loading(fold_shard_dir(dataset_path, 1, 'training'))
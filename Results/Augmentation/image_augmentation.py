@@ -1,51 +1,157 @@
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import cv2
 import numpy as np
 
-def augment_image(image_path):
-    # Load the image
+# The label lookup is shared with the preprocessing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Preprocessing'))
+from dataset_files import is_image_file, label_path_for
+
+# Default augmentation ranges, in the same terms as the ultralytics training arguments
+DEFAULT_OPTIONS = {
+    'hsv_s': 0.4,  # Saturation variation (factor drawn in [1 - hsv_s, 1 + hsv_s])
+    'hsv_v': 0.4,  # Value (brightness) variation
+    'zoom': (0.5, 1.0),  # Fraction of the image side kept by the crop, resized back to the original size
+    'random_crop': True,  # Random crop position, otherwise the crop is centred
+    'fliplr': 0.5,  # Probability of a horizontal flip
+    'min_visibility': 0.3,  # Boxes keeping less than this fraction of their area inside the crop are dropped
+}
+
+# Function to read a YOLO label file into an (N, 5) float32 array of class, x_center, y_center, width, height
+def read_labels(label_path):
+    with open(label_path, 'r') as f:
+        rows = [line.split()[:5] for line in f if line.strip()]
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+# Augmentation 1 and 2: saturation and brightness in a single HSV round trip, with lookup tables
+def adjust_saturation_brightness(image, saturation_factor=1.2, brightness_factor=1.4):
+    hue, saturation, value = cv2.split(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+    values = np.arange(256, dtype=np.float32)
+    saturation = cv2.LUT(saturation, np.clip(values * saturation_factor, 0, 255).astype(np.uint8))
+    value = cv2.LUT(value, np.clip(values * brightness_factor, 0, 255).astype(np.uint8))
+    return cv2.cvtColor(cv2.merge([hue, saturation, value]), cv2.COLOR_HSV2BGR)
+
+# Augmentation 3: zoom (crop a window and resize back to original), moving the boxes with it
+def crop_and_zoom(image, labels, zoom_factor=0.5, top=None, left=None, min_visibility=0.3):
+    h, w = image.shape[:2]
+    new_h, new_w = int(h * zoom_factor), int(w * zoom_factor)
+    # Crop the center of the image unless a position is given
+    top = (h - new_h) // 2 if top is None else top
+    left = (w - new_w) // 2 if left is None else left
+    cropped = image[top:top + new_h, left:left + new_w]
+    # Resize back to original size
+    zoomed = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    # Boxes in pixels, clipped to the crop window
+    x1 = (labels[:, 1] - labels[:, 3] / 2) * w
+    y1 = (labels[:, 2] - labels[:, 4] / 2) * h
+    x2 = (labels[:, 1] + labels[:, 3] / 2) * w
+    y2 = (labels[:, 2] + labels[:, 4] / 2) * h
+    clipped_x1, clipped_x2 = np.clip(x1, left, left + new_w), np.clip(x2, left, left + new_w)
+    clipped_y1, clipped_y2 = np.clip(y1, top, top + new_h), np.clip(y2, top, top + new_h)
+    visible_area = (clipped_x2 - clipped_x1) * (clipped_y2 - clipped_y1)
+    keep = visible_area >= min_visibility * (x2 - x1) * (y2 - y1) + 1e-9
+
+    # Normalised to the crop, which the resize keeps unchanged
+    zoomed_labels = np.column_stack([
+        labels[:, 0],
+        ((clipped_x1 + clipped_x2) / 2 - left) / new_w,
+        ((clipped_y1 + clipped_y2) / 2 - top) / new_h,
+        (clipped_x2 - clipped_x1) / new_w,
+        (clipped_y2 - clipped_y1) / new_h,
+    ]).astype(np.float32)[keep]
+    return zoomed, zoomed_labels
+
+# Augmentation 4: horizontal flip, mirroring the box centres
+def flip_image(image, labels):
+    flipped_labels = labels.copy()
+    flipped_labels[:, 1] = 1.0 - flipped_labels[:, 1]
+    return cv2.flip(image, 1), flipped_labels  # 1 indicates horizontal flip
+
+# Function to apply the augmentations with parameters drawn from 'rng'
+def augment_image(image, labels, rng, options=DEFAULT_OPTIONS):
+    h, w = image.shape[:2]
+    saturation_factor = rng.uniform(1 - options['hsv_s'], 1 + options['hsv_s'])
+    brightness_factor = rng.uniform(1 - options['hsv_v'], 1 + options['hsv_v'])
+    augmented = adjust_saturation_brightness(image, saturation_factor, brightness_factor)
+
+    zoom_factor = rng.uniform(*options['zoom'])
+    top = left = None
+    if options['random_crop']:
+        top = int(rng.integers(0, h - int(h * zoom_factor) + 1))
+        left = int(rng.integers(0, w - int(w * zoom_factor) + 1))
+    augmented, labels = crop_and_zoom(augmented, labels, zoom_factor, top, left, options['min_visibility'])
+
+    if rng.random() < options['fliplr']:
+        augmented, labels = flip_image(augmented, labels)
+    return augmented, labels
+
+# Function to write 'copies' augmented versions of one image and its label, returning the number written
+def augment_file(image_file, image_folder, output_folder, copies=1, seed=0, options=DEFAULT_OPTIONS):
+    # An image without a label would be written with an empty one and train as a background image, so it is skipped
+    label_path = label_path_for(os.path.join(image_folder, image_file))
+    if label_path is None:
+        print(f"No label found for {image_file}, skipped")
+        return 0
+    image = cv2.imread(os.path.join(image_folder, image_file))
+    if image is None:
+        print(f"Failed to read image: {image_file}")
+        return 0
+    image_name, ext = os.path.splitext(image_file)
+    labels = read_labels(label_path)
+
+    # Seeded per image, so the output does not depend on the number of workers or their scheduling
+    rng = np.random.default_rng([seed, int.from_bytes(hashlib.sha1(image_file.encode()).digest()[:8], 'big')])
+    for copy_index in range(copies):
+        augmented, augmented_labels = augment_image(image, labels, rng, options)
+        output_name = f"{image_name}_aug{copy_index}"
+        cv2.imwrite(os.path.join(output_folder, f"{output_name}{ext}"), augmented)
+        with open(os.path.join(output_folder, f"{output_name}.txt"), 'w') as f:
+            f.writelines(f"{int(cls)} {xc:.6f} {yc:.6f} {bw:.6f} {bh:.6f}\n" for cls, xc, yc, bw, bh in augmented_labels)
+    return copies
+
+# Function to augment every image of a folder with its labels across a process pool
+def augment_folder(image_folder, output_folder, copies=1, seed=0, options=None, workers=None, chunksize=16):
+    start_time = time.time()
+    os.makedirs(output_folder, exist_ok=True)
+    image_files = sorted(f for f in os.listdir(image_folder) if is_image_file(f))
+
+    augment = partial(augment_file, image_folder=image_folder, output_folder=output_folder, copies=copies, seed=seed,
+                      options={**DEFAULT_OPTIONS, **(options or {})})
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        written = sum(executor.map(augment, image_files, chunksize=chunksize))
+
+    total_time = time.time() - start_time
+    print(f"Wrote {written} augmented images from {len(image_files)} images in {total_time:.2f} seconds "
+          f"({written / max(total_time, 1e-9):.1f} images/s) to {output_folder}")
+
+# Function to apply the fixed combination of the example figure: saturation +20%, brightness +40%, centred 50% zoom
+# and horizontal flip
+def augment_example(image_path, output_path):
     image = cv2.imread(image_path)
     if image is None:
         raise ValueError("The image cannot be loaded. Check the image path.")
-    
-    # Augmentation 1: saturation
-    def adjust_saturation(image, scale=0.2):
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        factor = 1 + scale
-        hsv_image[:, :, 1] = np.clip(hsv_image[:, :, 1] * factor, 0, 255)
-        return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR)
-
-    # Augmentation 2: brightness
-    def adjust_brightness(image, scale=0.4):
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        factor = 1 + scale
-        hsv_image[:, :, 2] = np.clip(hsv_image[:, :, 2] * factor, 0, 255)
-        return cv2.cvtColor(hsv_image, cv2.COLOR_HSV2BGR)
-
-    # Augmentation 3: zoom (center crop and resize back to original)
-    def zoom_image(image, zoom_factor=0.5):
-        h, w = image.shape[:2]
-        new_h, new_w = int(h * zoom_factor), int(w * zoom_factor)
-        # Crop the center of the image
-        top = (h - new_h) // 2
-        left = (w - new_w) // 2
-        cropped = image[top:top + new_h, left:left + new_w]
-        # Resize back to original size
-        return cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LINEAR)
-
-    # Augmentation 4: horizontal flip
-    def flip_image(image):
-        return cv2.flip(image, 1)  # 1 indicates horizontal flip
-
-    # Apply augmentations sequentially
-    augmented_image = adjust_saturation(image)
-    augmented_image = adjust_brightness(augmented_image)
-    augmented_image = zoom_image(augmented_image)
-    augmented_image = flip_image(augmented_image)
-
-    # Save the final augmented image
-    output_path = "./augmented_combined_image.jpg"
+    no_labels = np.zeros((0, 5), dtype=np.float32)
+    augmented_image = adjust_saturation_brightness(image, saturation_factor=1.2, brightness_factor=1.4)
+    augmented_image, _ = crop_and_zoom(augmented_image, no_labels, zoom_factor=0.5)
+    augmented_image, _ = flip_image(augmented_image, no_labels)
     cv2.imwrite(output_path, augmented_image)
     print(f"Combined augmentation image saved as {output_path}")
 
-# Usage example
-augment_image("Results/Augmentation/img.jpg")
+if __name__ == '__main__':
+    # Example image augmented with the fixed settings, as in augmented_combined_image.jpg
+    augment_example("Results/Augmentation/img.jpg", "./augmented_combined_image.jpg")
+
+    # Folder with the images and their .txt labels (next to them or in the sibling 'labels' folder) to augment with random parameters drawn from DEFAULT_OPTIONS
+    # (None to only run the example), and folder for the augmented pairs
+    image_folder = None  # e.g. 'path/to/fold_1/training/images'
+    output_folder = 'Results/Augmentation/augmented'
+
+    # Augmented copies per image and seed of the random parameters
+    if image_folder:
+        augment_folder(image_folder, output_folder, copies=2, seed=0)
@@ -1,6 +1,11 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+import sys
+
+# The combined score is shared with the early stopping callback of the training scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Model'))
+from combined_score import combined_score as compute_combined_score
 
 # Directory containing the CSV files
 csv_folder = 'Results'
@@ -38,19 +43,9 @@ for idx, df in enumerate(dfs):
     precision = df['metrics/precision(B)']
     recall = df['metrics/recall(B)']
 
-    # Normalized coefficients for calculating the combined score
-    coeff_box_loss = 0.5  # Normalized weight for box losses
-    coeff_cls_loss = 0.5  # Normalized weight for class losses
-    coeff_precision = 0.375  # Normalized weight for precision
-    coeff_recall = 0.375  # Normalized weight for recall
-    coeff_map50 = 0.25  # Normalized weight for mAP50
-
-    # Calculate a combined score
-    combined_score = (mAP50 * coeff_map50 +
-                      precision * coeff_precision + 
-                      recall * coeff_recall - 
-                      (val_box_loss * coeff_box_loss) - 
-                      (val_cls_loss * coeff_cls_loss))
+    # Calculate the combined score with the normalized weights of COMBINED_SCORE_WEIGHTS
+    # (mAP50 0.25, precision 0.375, recall 0.375, box and class losses 0.5, subtracted)
+    combined_score = compute_combined_score(df)
 
     # Find the epoch with the highest score
     best_epoch = combined_score.idxmax()
@@ -0,0 +1,158 @@
+import csv
+import os
+import random
+import shutil
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from ensemble import letterbox
+from pipeline import list_images
+
+# Function to get the path of the exported model cached next to the .pt checkpoint (same names ultralytics uses)
+def exported_model_path(model_path, backend, int8=False):
+    base = os.path.splitext(model_path)[0]
+    if backend == 'onnx':
+        return f'{base}_int8.onnx' if int8 else f'{base}.onnx'
+    if backend == 'openvino':
+        return f'{base}_int8_openvino_model' if int8 else f'{base}_openvino_model'
+    raise ValueError(f"Unknown backend '{backend}', expected 'pytorch', 'onnx' or 'openvino'.")
+
+# Function to copy a reproducible sample of the fold's test images (and labels) used to calibrate INT8 quantization
+def prepare_calibration_set(model_path, images_folder, labels_folder=None, calibration_size=200, seed=0):
+    calibration_dir = f'{os.path.splitext(model_path)[0]}_calibration'
+    os.makedirs(os.path.join(calibration_dir, 'images'), exist_ok=True)
+    os.makedirs(os.path.join(calibration_dir, 'labels'), exist_ok=True)
+
+    image_files = list_images(images_folder)
+    sample = random.Random(seed).sample(image_files, min(calibration_size, len(image_files)))
+    for image_file in sample:
+        shutil.copy(os.path.join(images_folder, image_file), os.path.join(calibration_dir, 'images', image_file))
+        label_file = f'{os.path.splitext(image_file)[0]}.txt'
+        if labels_folder and os.path.exists(os.path.join(labels_folder, label_file)):
+            shutil.copy(os.path.join(labels_folder, label_file), os.path.join(calibration_dir, 'labels', label_file))
+
+    # Data YAML in the format used by the training scripts, pointing at the calibration sample
+    data_yaml_path = os.path.join(calibration_dir, 'data.yaml')
+    calibration_images = os.path.join(calibration_dir, 'images')
+    with open(data_yaml_path, 'w') as f:
+        f.write(f"train: {calibration_images}\nval: {calibration_images}\nnc: 1\nnames: ['fish']\n")
+    return calibration_images, data_yaml_path
+
+# Function to quantize an ONNX model to INT8 with onnxruntime static quantization
+def quantize_onnx(onnx_path, int8_path, calibration_images, imgsz=640):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class LetterboxCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.image_paths = iter(os.path.join(calibration_images, f) for f in list_images(calibration_images))
+
+        def get_next(self):
+            for image_path in self.image_paths:
+                image = cv2.imread(image_path)
+                if image is None:
+                    continue
+                # Same preprocessing as inference: letterbox, BGR to RGB, HWC to CHW, [0, 1]
+                letterboxed = letterbox(image, imgsz)[0]
+                tensor = letterboxed[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+                return {'images': np.ascontiguousarray(tensor)}
+            return None
+
+    quantize_static(onnx_path, int8_path, LetterboxCalibrationReader(), quant_format=QuantFormat.QDQ,
+                    per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+# Function to export a checkpoint to ONNX or OpenVINO once, optionally INT8, reusing the cached export when up to date
+def export_model(model_path, backend, int8=False, calibration_folder=None, calibration_labels_folder=None,
+                 imgsz=640, calibration_size=200):
+    exported_path = exported_model_path(model_path, backend, int8)
+    if os.path.exists(exported_path) and os.path.getmtime(exported_path) >= os.path.getmtime(model_path):
+        return exported_path
+
+    if int8 and calibration_folder is None:
+        raise ValueError("INT8 export requires 'calibration_folder' (e.g. the fold's test images).")
+
+    print(f"Exporting {model_path} to {backend}{' INT8' if int8 else ''}...")
+    model = YOLO(model_path)
+    if backend == 'onnx':
+        # Dynamic axes so the batched pipelines can send several images per call
+        onnx_path = model.export(format='onnx', imgsz=imgsz, dynamic=True)
+        if int8:
+            calibration_images, _ = prepare_calibration_set(model_path, calibration_folder, calibration_labels_folder,
+                                                            calibration_size)
+            quantize_onnx(onnx_path, exported_path, calibration_images, imgsz)
+    else:
+        data_yaml_path = None
+        if int8:
+            _, data_yaml_path = prepare_calibration_set(model_path, calibration_folder, calibration_labels_folder,
+                                                        calibration_size)
+        model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=int8, data=data_yaml_path)
+    print(f"Exported model saved to: {exported_path}")
+    return exported_path
+
+# Function to load a fold checkpoint through the requested backend ('pytorch', 'onnx' or 'openvino').
+# 'exported_path' skips the export check, for worker processes loading a model their parent already exported
+def load_model(model_path, backend='pytorch', int8=False, calibration_folder=None, calibration_labels_folder=None,
+               imgsz=640, exported_path=None):
+    if backend == 'pytorch':
+        return YOLO(model_path)
+    if exported_path is None:
+        exported_path = export_model(model_path, backend, int8, calibration_folder, calibration_labels_folder, imgsz)
+    return YOLO(exported_path, task='detect')
+
+# Function to export the checkpoint once before starting worker processes, returning the backend options they load with
+def prepare_worker_backend(model_path, backend_options=None):
+    backend_options = dict(backend_options or {})
+    if backend_options.get('backend', 'pytorch') != 'pytorch' and backend_options.get('exported_path') is None:
+        export_options = {key: value for key, value in backend_options.items() if key != 'exported_path'}
+        backend_options['exported_path'] = export_model(model_path, **export_options)
+    return backend_options
+
+# Function to compare latency and mAP50 of the backends on a fold's test images
+def compare_backends(model_path, data_yaml_path, images_folder, labels_folder=None, backends=None,
+                     num_images=100, imgsz=640):
+    if backends is None:
+        backends = [('pytorch', False), ('onnx', False), ('onnx', True), ('openvino', False), ('openvino', True)]
+
+    # Decode the timing sample once so only the model is measured
+    images = [cv2.imread(os.path.join(images_folder, f)) for f in list_images(images_folder)[:num_images]]
+    images = [image for image in images if image is not None]
+
+    rows = []
+    for backend, int8 in backends:
+        model = load_model(model_path, backend, int8, images_folder, labels_folder, imgsz)
+
+        # Warm up, then time one image per call as on the field laptops
+        for image in images[:3]:
+            model.predict(source=image, imgsz=imgsz, verbose=False)
+        start_time = time.perf_counter()
+        for image in images:
+            model.predict(source=image, imgsz=imgsz, verbose=False)
+        latency_ms = 1000 * (time.perf_counter() - start_time) / max(1, len(images))
+
+        metrics = model.val(data=data_yaml_path, imgsz=imgsz, batch=1, plots=False, verbose=False)
+        name = f"{backend}{' int8' if int8 else ''}"
+        rows.append({'backend': name, 'latency_ms': round(latency_ms, 2), 'mAP50': round(float(metrics.box.map50), 4)})
+        print(f"{name}: {latency_ms:.2f} ms/image, mAP50 = {metrics.box.map50:.4f}")
+
+    # Save the comparison next to the checkpoint
+    comparison_path = os.path.join(os.path.dirname(model_path), 'backend_comparison.csv')
+    with open(comparison_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['backend', 'latency_ms', 'mAP50'])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Comparison saved to: {comparison_path}")
+    return rows
+
+if __name__ == '__main__':
+    # Path to the trained model (e.g., best.pt)
+    model_path = '/Users/emsar/OneDrive/Desktop/materiale progetto cv/resultsv8Small300/epoche/fold 5/best.pt'
+
+    # Data YAML of the fold and its test images, used for mAP50 and INT8 calibration
+    data_yaml_path = '/Users/emsar/OneDrive/Desktop/materiale progetto cv/Output fold/fold_5_data.yaml'
+    images_folder = '/Users/emsar/OneDrive/Desktop/materiale progetto cv/Output fold/fold_5/test/images'
+    labels_folder = '/Users/emsar/OneDrive/Desktop/materiale progetto cv/Output fold/fold_5/test/labels'
+
+    # Compare the PyTorch backend with the exported ones
+    compare_backends(model_path, data_yaml_path, images_folder, labels_folder)
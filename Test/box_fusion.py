@@ -0,0 +1,80 @@
+import numpy as np
+
+# Function to compute the IoU between one box and an array of boxes, all in (x1, y1, x2, y2) format
+def box_iou(box, boxes):
+    inter_w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    intersection = inter_w * inter_h
+    box_area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / (box_area + areas - intersection + 1e-9)
+
+# Function to compute the intersection over the smaller area between one box and an array of boxes
+def box_ios(box, boxes):
+    inter_w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    box_area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter_w * inter_h / (np.minimum(box_area, areas) + 1e-9)
+
+# Function to apply non-maximum suppression, returning the indices of the kept boxes by decreasing score
+def nms(boxes, scores, iou_threshold=0.5, ios_threshold=None):
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        suppressed = box_iou(boxes[best], boxes[order[1:]]) > iou_threshold
+
+        # Boxes cut by a tile border are mostly contained in the full box, which IoU alone misses
+        if ios_threshold is not None:
+            suppressed |= box_ios(boxes[best], boxes[order[1:]]) > ios_threshold
+        order = order[1:][~suppressed]
+    return np.array(keep, dtype=np.int64)
+
+# Function to run NMS separately for every class, returning the kept (boxes, scores, classes)
+def class_wise_nms(boxes, scores, classes, iou_threshold=0.5, ios_threshold=None):
+    keep = []
+    for cls in np.unique(classes):
+        indices = np.flatnonzero(classes == cls)
+        keep.extend(indices[nms(boxes[indices], scores[indices], iou_threshold, ios_threshold)])
+    keep = np.array(sorted(keep, key=lambda i: -scores[i]), dtype=np.int64)
+    return boxes[keep].reshape(-1, 4), scores[keep], classes[keep]
+
+# Function to fuse the boxes predicted by several models with weighted box fusion
+def weighted_boxes_fusion(boxes_list, scores_list, classes_list, iou_threshold=0.55):
+    num_models = len(boxes_list)
+    boxes = np.concatenate(boxes_list).reshape(-1, 4)
+    scores = np.concatenate(scores_list)
+    classes = np.concatenate(classes_list)
+
+    fused_boxes, fused_scores, fused_classes = [], [], []
+    for cls in np.unique(classes):
+        indices = np.flatnonzero(classes == cls)
+        indices = indices[np.argsort(-scores[indices], kind='stable')]
+
+        # Each cluster keeps the score-weighted sum of its boxes and the list of its scores
+        cluster_sums, cluster_scores, cluster_boxes = [], [], []
+        for i in indices:
+            if cluster_boxes:
+                overlaps = box_iou(boxes[i], np.array(cluster_boxes))
+                best = int(np.argmax(overlaps))
+                if overlaps[best] > iou_threshold:
+                    cluster_sums[best] += boxes[i] * scores[i]
+                    cluster_scores[best].append(scores[i])
+                    cluster_boxes[best] = cluster_sums[best] / sum(cluster_scores[best])
+                    continue
+            cluster_sums.append(boxes[i] * scores[i])
+            cluster_scores.append([scores[i]])
+            cluster_boxes.append(boxes[i].copy())
+
+        # Boxes found by only some of the models are down-weighted
+        for fused_box, box_scores in zip(cluster_boxes, cluster_scores):
+            fused_boxes.append(fused_box)
+            fused_scores.append(np.mean(box_scores) * min(len(box_scores), num_models) / num_models)
+            fused_classes.append(cls)
+
+    order = np.argsort(-np.array(fused_scores), kind='stable')
+    return (np.array(fused_boxes, dtype=np.float32).reshape(-1, 4)[order],
+            np.array(fused_scores, dtype=np.float32)[order],
+            np.array(fused_classes, dtype=np.float32)[order])
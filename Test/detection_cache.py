@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+# The content hash is shared with the dataset index
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from dataset_files import file_sha1
+
+# Confidence used to fill the cache, thresholds above it are applied afterwards
+CACHE_CONFIDENCE_FLOOR = 0.001
+
+# Function to hash the content of many files on a thread pool, returning {file_name: sha1}
+def hash_files(folder_path, file_names, num_threads=8):
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        hashes = executor.map(file_sha1, [os.path.join(folder_path, f) for f in file_names])
+        return dict(zip(file_names, hashes))
+
+# Function to convert a result into an (N, 6) float32 array of normalised x1, y1, x2, y2, confidence and class
+def result_to_detections(result):
+    boxes = result.boxes.cpu()
+    return np.column_stack([boxes.xyxyn.numpy(), boxes.conf.numpy(), boxes.cls.numpy()]).astype(np.float32).reshape(-1, 6)
+
+# Function to build a Results object back from cached detections, keeping the boxes above the threshold
+def detections_to_result(image, image_file, detections, names, confidence_threshold):
+    height, width = image.shape[:2]
+    kept = detections[detections[:, 4] >= confidence_threshold]
+    boxes = np.column_stack([kept[:, :4] * [width, height, width, height], kept[:, 4:]]).astype(np.float32)
+    return Results(orig_img=image, path=image_file, names=names, boxes=torch.from_numpy(boxes))
+
+# Disk cache of raw detections keyed by image content, stored as memory-mapped columnar .npy files
+class DetectionCache:
+    def __init__(self, cache_root, model_path, settings):
+        # One cache folder per checkpoint content and inference settings
+        key_source = json.dumps({'checkpoint': file_sha1(model_path), **settings}, sort_keys=True, default=str)
+        self.cache_dir = os.path.join(cache_root, hashlib.sha1(key_source.encode()).hexdigest()[:16])
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, 'settings.json'), 'w') as f:
+            f.write(key_source)
+
+        # keys[i] is the image hash whose detections are detections[offsets[i]:offsets[i + 1]]
+        self._keys = np.zeros(0, dtype='S40')
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._detections = np.zeros((0, 6), dtype=np.float32)
+        self._load()
+        self._index = {key.decode(): i for i, key in enumerate(self._keys)}
+        self._pending = {}
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, f'{name}.npy')
+
+    def _load(self):
+        if not os.path.exists(self._path('keys')):
+            return
+        keys = np.load(self._path('keys'))
+        offsets = np.load(self._path('offsets'))
+        detections = np.load(self._path('detections'), mmap_mode='r')
+
+        # An interrupted flush leaves files of mismatched lengths, in which case the cache is rebuilt
+        if len(offsets) != len(keys) + 1 or offsets[-1] != len(detections):
+            print(f"Detection cache in {self.cache_dir} is inconsistent and will be rebuilt.")
+            return
+        self._keys, self._offsets, self._detections = keys, offsets, detections
+
+    def __len__(self):
+        return len(self._index) + len(self._pending)
+
+    # Function to get the cached detections of an image hash, or None when the image was never processed
+    def get(self, image_hash):
+        if image_hash in self._pending:
+            return self._pending[image_hash]
+        index = self._index.get(image_hash)
+        if index is None:
+            return None
+        return np.asarray(self._detections[self._offsets[index]:self._offsets[index + 1]])
+
+    # Function to add the detections of a newly processed image
+    def put(self, image_hash, detections):
+        if image_hash not in self._index:
+            self._pending[image_hash] = detections
+
+    # Function to append the pending detections to the files on disk
+    def flush(self):
+        if not self._pending:
+            return
+        new_keys = list(self._pending)
+        new_detections = [self._pending[key] for key in new_keys]
+        sizes = np.array([len(d) for d in new_detections], dtype=np.int64)
+
+        keys = np.concatenate([self._keys, np.array(new_keys, dtype='S40')])
+        offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(sizes)])
+        detections = np.concatenate([np.asarray(self._detections)] + new_detections).astype(np.float32).reshape(-1, 6)
+
+        # Release the memory map before its file is replaced
+        self._detections = detections
+
+        # Detections and offsets are replaced before the keys, so a crash is caught by the length check in _load
+        for name, array in (('detections', detections), ('offsets', offsets), ('keys', keys)):
+            temporary_path = os.path.join(self.cache_dir, f'{name}.tmp.npy')
+            np.save(temporary_path, array)
+            os.replace(temporary_path, self._path(name))
+
+        self._keys, self._offsets = keys, offsets
+        self._detections = np.load(self._path('detections'), mmap_mode='r')
+        self._index = {key.decode(): i for i, key in enumerate(keys)}
+        self._pending = {}
@@ -0,0 +1,109 @@
+import time
+
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+
+# non_max_suppression moved from ultralytics.utils.ops to ultralytics.utils.nms in recent releases
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:
+    from ultralytics.utils.ops import non_max_suppression
+
+from box_fusion import class_wise_nms, weighted_boxes_fusion
+
+# Function to letterbox an image into an 'imgsz' square, returning the image, the scale ratio and the (left, top) padding
+def letterbox(image, imgsz=640, pad_value=114):
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_left = (imgsz - new_width) // 2
+    pad_top = (imgsz - new_height) // 2
+    letterboxed = cv2.copyMakeBorder(image, pad_top, imgsz - new_height - pad_top, pad_left, imgsz - new_width - pad_left,
+                                     cv2.BORDER_CONSTANT, value=(pad_value, pad_value, pad_value))
+    return letterboxed, ratio, (pad_left, pad_top)
+
+# Function to stack letterboxed BGR images into a normalised RGB batch tensor
+def to_batch_tensor(letterboxed_images, device, half=False):
+    batch = np.ascontiguousarray(np.stack(letterboxed_images)[..., ::-1].transpose(0, 3, 1, 2))
+    batch = torch.from_numpy(batch).to(device)
+    batch = batch.half() if half else batch.float()
+    return batch / 255.0
+
+# Function to load the fold checkpoints as fused detection networks in evaluation mode
+def load_fold_models(model_paths, device, half=False):
+    networks = []
+    for model_path in model_paths:
+        network = YOLO(model_path).model.fuse().eval().to(device)
+        networks.append(network.half() if half else network.float())
+    return networks
+
+# Function to run every fold model on the same preprocessed batch and fuse their boxes
+def predict_ensemble(networks, images, names, device, imgsz=640, confidence_threshold=0.25, iou_threshold=0.7,
+                     fusion='wbf', fusion_iou=0.55, half=False, timings=None):
+    # Decode and letterbox once, the same tensor is shared by all models
+    start = time.perf_counter()
+    letterboxed = [letterbox(image, imgsz) for image in images]
+    batch = to_batch_tensor([item[0] for item in letterboxed], device, half)
+    if timings is not None:
+        timings['preprocess'] += time.perf_counter() - start
+
+    # Boxes of each image in original pixel coordinates, one entry per model
+    per_image = [[] for _ in images]
+    with torch.inference_mode():
+        for model_index, network in enumerate(networks):
+            start = time.perf_counter()
+            detections = non_max_suppression(network(batch), confidence_threshold, iou_threshold)
+            for image_index, detection in enumerate(detections):
+                detection = detection.float().cpu().numpy()
+                _, ratio, (pad_left, pad_top) = letterboxed[image_index]
+                height, width = images[image_index].shape[:2]
+
+                # Undo the letterbox to get back to the original image
+                boxes = (detection[:, :4] - [pad_left, pad_top, pad_left, pad_top]) / ratio
+                boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+                boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+                per_image[image_index].append((boxes, detection[:, 4], detection[:, 5]))
+            if timings is not None:
+                timings['models'][model_index] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = []
+    for image, model_outputs in zip(images, per_image):
+        boxes_list = [output[0] for output in model_outputs]
+        scores_list = [output[1] for output in model_outputs]
+        classes_list = [output[2] for output in model_outputs]
+
+        if fusion == 'wbf':
+            boxes, scores, classes = weighted_boxes_fusion(boxes_list, scores_list, classes_list, fusion_iou)
+        else:
+            boxes, scores, classes = class_wise_nms(np.concatenate(boxes_list).reshape(-1, 4), np.concatenate(scores_list),
+                                                    np.concatenate(classes_list), fusion_iou)
+
+        # Wrap the fused boxes in a Results object so they can be plotted and written like single-model results
+        fused = np.column_stack([boxes, scores, classes]).astype(np.float32)
+        results.append(Results(orig_img=image, path='', names=names, boxes=torch.from_numpy(fused)))
+    if timings is not None:
+        timings['fusion'] += time.perf_counter() - start
+
+    return results
+
+# Function to create the latency accumulators used by predict_ensemble
+def new_ensemble_timings(num_models):
+    return {'preprocess': 0.0, 'models': [0.0] * num_models, 'fusion': 0.0}
+
+# Function to print the per-model and total latency per image
+def print_ensemble_timings(model_paths, timings, image_count, elapsed_time):
+    if image_count == 0:
+        print("No images processed.")
+        return
+    print(f"Preprocessing: {1000 * timings['preprocess'] / image_count:.2f} ms/image")
+    for model_path, model_time in zip(model_paths, timings['models']):
+        print(f"Model {model_path}: {1000 * model_time / image_count:.2f} ms/image")
+    print(f"Fusion: {1000 * timings['fusion'] / image_count:.2f} ms/image")
+    print(f"Total: {1000 * elapsed_time / image_count:.2f} ms/image ({image_count / elapsed_time:.2f} images/s)")
@@ -1,6 +1,20 @@
 from ultralytics import YOLO
 import cv2
 import os
+import sys
+import time
+import torch
+
+from backends import load_model
+from ensemble import load_fold_models, new_ensemble_timings, predict_ensemble, print_ensemble_timings
+from pipeline import batched, list_images, prefetch_folder, predict_in_batches, read_video_frames
+from result_writer import ResultWriter
+from tiling import new_tiling_stats, predict_tiled, print_tiling_stats
+
+# The shard cache lives with the preprocessing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from dataset_files import is_image_file
+from shard_cache import ShardReader
 
 # Function to extract fold number and model name from model path
 def extract_info_from_model_path(model_path):
@@ -26,45 +40,212 @@ def run_inference_on_folder(model_path, folder_path, confidence_threshold=0.25):
 
     # Define directory to save the inference results
     save_dir = 'InferenceResults'
-    os.makedirs(save_dir, exist_ok=True)
 
-    # Loop through all images in the folder
-    for image_file in os.listdir(folder_path):
-        # Only process files with common image extensions
-        if image_file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-            image_path = os.path.join(folder_path, image_file)
-            img = cv2.imread(image_path)
+    # Rendering and encoding run on the writer threads while the next image is processed
+    with ResultWriter(save_dir) as writer:
+        # Loop through all images in the folder
+        for image_file in os.listdir(folder_path):
+            # Only process files with common image extensions
+            if is_image_file(image_file):
+                image_path = os.path.join(folder_path, image_file)
+                img = cv2.imread(image_path)
+
+                if img is None:
+                    print(f"Image at {image_path} not found or unable to open.")
+                    continue
+
+                # Perform inference with the confidence threshold on the already decoded image
+                results = model.predict(source=img, conf=confidence_threshold)
+
+                # Save the results with bounding boxes as images, using the required name format
+                for idx, result in enumerate(results):
+                    image_name, ext = os.path.splitext(image_file)
+                    writer.submit(result, f'{image_name}_{fold_number}_{model_name}_{confidence_threshold:.2f}')
+
+    print(f"Results saved to: {save_dir}")
+
+# Function to perform batched inference on a folder, with images decoded ahead of the model by a thread pool
+def run_batched_inference_on_folder(model_path, folder_path, confidence_threshold=0.25,
+                                    batch_size=16, num_decoders=4, prefetch_depth=64,
+                                    jpeg_quality=95, save_images=True, save_labels=False, tile_options=None,
+                                    backend_options=None, dataset_index=None, shard_dir=None):
+    # Shards hold images downscaled to the training size, too small to tile and not the originals to annotate,
+    # so only the label files are written from them
+    if shard_dir and tile_options:
+        raise ValueError("shard_dir holds downscaled images, use it without tile_options or run on the original folder.")
+    if shard_dir and save_images:
+        print("Warning: shard_dir holds downscaled images, writing the label files instead of annotated images.")
+        save_images, save_labels = False, True
+
+    # Load the YOLOv8 model, exported to ONNX/OpenVINO when a CPU backend is requested
+    model = load_model(model_path, **(backend_options or {}))
+
+    # Extract fold number and model name from model path
+    fold_number, model_name = extract_info_from_model_path(model_path)
+
+    # Define directory to save the inference results
+    save_dir = 'InferenceResults'
+
+    if shard_dir:
+        # Resized images read from the shard cache, nothing left to decode, only the label files are written
+        decoded_images = ShardReader(shard_dir).iter_images()
+    else:
+        # Images are decoded ahead of the model, unreadable files are reported and dropped before batching
+        image_files = list_images(folder_path, dataset_index)
+        decoded_images = prefetch_folder(folder_path, num_decoders, prefetch_depth, image_files)
+
+    # In tiled mode 'batch_size' frames are cut into tiles that go through the model together
+    tiling_stats = new_tiling_stats()
+    if tile_options:
+        predictions = predict_tiled(model, decoded_images, batch_size, confidence_threshold, stats=tiling_stats, **tile_options)
+    else:
+        predictions = predict_in_batches(model, decoded_images, batch_size, confidence_threshold)
+
+    start_time = time.perf_counter()
+    image_count = 0
+    with ResultWriter(save_dir, jpeg_quality=jpeg_quality, save_images=save_images, save_labels=save_labels) as writer:
+        for image_file, result in predictions:
+            # Queue the result using the required name format, rendering happens on the writer threads
+            image_name, ext = os.path.splitext(image_file)
+            writer.submit(result, f'{image_name}_{fold_number}_{model_name}_{confidence_threshold:.2f}')
+            image_count += 1
+
+    elapsed_time = time.perf_counter() - start_time
+    images_per_second = image_count / elapsed_time if elapsed_time > 0 else 0
+    print(f"Processed {image_count} images in {elapsed_time:.2f} s ({images_per_second:.2f} images/s)")
+    if tile_options:
+        print_tiling_stats(tiling_stats, tile_options.get('tile_size', 640), tile_options.get('overlap', 0.2), elapsed_time)
+    print(f"Results saved to: {save_dir}")
+
+# Function to perform inference directly on the frames of a video file or stream
+def run_inference_on_video(model_path, video_source, confidence_threshold=0.25, batch_size=16,
+                           frame_stride=1, start_time=None, end_time=None, prefetch_depth=64,
+                           jpeg_quality=95, save_images=True, save_labels=False, backend_options=None):
+    # Load the YOLOv8 model, exported to ONNX/OpenVINO when a CPU backend is requested
+    model = load_model(model_path, **(backend_options or {}))
+
+    # Extract fold number and model name from model path
+    fold_number, model_name = extract_info_from_model_path(model_path)
+
+    # Define directory to save the inference results
+    save_dir = 'InferenceResults'
+
+    # Camera indices and stream URLs have no file name to reuse for the results
+    if isinstance(video_source, int) or '://' in str(video_source):
+        video_name = 'stream'
+    else:
+        video_name = os.path.splitext(os.path.basename(video_source))[0]
+
+    # Frames are decoded by a producer thread and buffered in a bounded queue
+    frames = read_video_frames(video_source, frame_stride, start_time, end_time, prefetch_depth)
+    named_frames = ((f'{video_name}_{frame_index:06d}', frame) for frame_index, _, frame in frames)
 
-            if img is None:
-                print(f"Image at {image_path} not found or unable to open.")
-                continue
+    start = time.perf_counter()
+    frame_count = 0
+    with ResultWriter(save_dir, jpeg_quality=jpeg_quality, save_images=save_images, save_labels=save_labels) as writer:
+        for frame_name, result in predict_in_batches(model, named_frames, batch_size, confidence_threshold):
+            # Queue the result using the required name format, rendering happens on the writer threads
+            writer.submit(result, f'{frame_name}_{fold_number}_{model_name}_{confidence_threshold:.2f}')
+            frame_count += 1
 
-            # Perform inference with the confidence threshold
-            results = model.predict(source=image_path, conf=confidence_threshold)
+    elapsed_time = time.perf_counter() - start
+    frames_per_second = frame_count / elapsed_time if elapsed_time > 0 else 0
+    print(f"Processed {frame_count} frames in {elapsed_time:.2f} s ({frames_per_second:.2f} frames/s)")
+    print(f"Results saved to: {save_dir}")
 
-            # Save the results with bounding boxes as images
-            for idx, result in enumerate(results):
-                # Plot bounding boxes on the image
-                result_image = result.plot()
+# Function to perform inference on a folder with the ensemble of all fold models
+def run_ensemble_inference_on_folder(model_paths, folder_path, confidence_threshold=0.25, batch_size=16,
+                                     num_decoders=4, prefetch_depth=64, fusion='wbf',
+                                     jpeg_quality=95, save_images=True, save_labels=False):
+    # Load every fold checkpoint once, in half precision on GPU
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    half = device.type == 'cuda'
+    networks = load_fold_models(model_paths, device, half)
+    class_names = networks[0].names
 
-                # Define the save path using the required format
+    # Define directory to save the inference results
+    save_dir = 'InferenceResults'
+
+    # Images are decoded ahead of the model, unreadable files are reported and dropped before batching
+    decoded_images = prefetch_folder(folder_path, num_decoders, prefetch_depth)
+
+    timings = new_ensemble_timings(len(networks))
+    start_time = time.perf_counter()
+    image_count = 0
+    with ResultWriter(save_dir, jpeg_quality=jpeg_quality, save_images=save_images, save_labels=save_labels) as writer:
+        for batch in batched(decoded_images, batch_size):
+            images = [img for _, img in batch]
+            results = predict_ensemble(networks, images, class_names, device, confidence_threshold=confidence_threshold,
+                                       fusion=fusion, half=half, timings=timings)
+            for (image_file, _), result in zip(batch, results):
                 image_name, ext = os.path.splitext(image_file)
-                save_path = os.path.join(
-                    save_dir, 
-                    f'{image_name}_{fold_number}_{model_name}_{confidence_threshold:.2f}.jpg'
-                )
-                cv2.imwrite(save_path, result_image)
-                print(f"Result saved to: {save_path}")
+                writer.submit(result, f'{image_name}_ensemble_{fusion}_{confidence_threshold:.2f}')
+                image_count += 1
+
+    elapsed_time = time.perf_counter() - start_time
+    print_ensemble_timings(model_paths, timings, image_count, elapsed_time)
+    print(f"Results saved to: {save_dir}")
 
 if __name__ == '__main__':
     # Path to the trained model (e.g., best.pt)
     model_path = '/Users/fede0/OneDrive/Desktop/trasferimento/fold 1/best.pt'
 
+    # Paths to the fold checkpoints used in ensemble mode (None to use the single model above)
+    ensemble_model_paths = None  # e.g. [f'/Users/fede0/OneDrive/Desktop/trasferimento/fold {i}/best.pt' for i in range(1, 6)]
+
+    # Box fusion used by the ensemble: 'wbf' (weighted box fusion) or 'nms'
+    fusion = 'wbf'
+
     # Path to the folder containing images
     folder_path = '/Users/fede0/OneDrive/Desktop/video_nuovo/video_nuovo/'
 
+    # Path or URL of an ROV video to read frames from directly (None to use the image folder)
+    video_path = None
+
+    # Keep one frame every 'frame_stride' and only between 'start_time' and 'end_time' seconds (None for no limit)
+    frame_stride = 5
+    start_time = None
+    end_time = None
+
     # Confidence threshold
     confidence_threshold = 0.5
 
-    # Run inference on the folder
-    run_inference_on_folder(model_path, folder_path, confidence_threshold)
+    # Number of images per predict call, decoder threads and decoded images buffered ahead of the model
+    batch_size = 16
+    num_decoders = 4
+    prefetch_depth = 64
+
+    # Tiled inference for small, distant fish: overlapping tiles at native resolution (None to resize whole frames)
+    tile_options = None  # e.g. {'tile_size': 640, 'overlap': 0.2, 'min_std': 8.0}
+
+    # Inference backend: PyTorch by default, or an ONNX/OpenVINO export (optionally INT8) cached next to the .pt
+    backend_options = None  # e.g. {'backend': 'openvino', 'int8': True, 'calibration_folder': '.../fold_1/test/images'}
+
+    # Output options: JPEG quality of the annotated images, whether to render them and whether to write YOLO .txt predictions
+    jpeg_quality = 90
+    save_images = True
+    save_labels = False
+
+    # Dataset index used as the image list instead of listing the folder (Preprocessing/dataset_index.py, None to list)
+    dataset_index = None
+
+    # Shard folder of the images written by Preprocessing/shard_cache.py, read instead of the folder (None to decode files).
+    # The shards are downscaled, so only label files are written from them and tile_options must stay None
+    shard_dir = None
+
+    if ensemble_model_paths:
+        # Run the fold ensemble on the folder
+        run_ensemble_inference_on_folder(ensemble_model_paths, folder_path, confidence_threshold, batch_size,
+                                         num_decoders, prefetch_depth, fusion,
+                                         jpeg_quality, save_images, save_labels)
+    elif video_path:
+        # Run inference on the video frames
+        run_inference_on_video(model_path, video_path, confidence_threshold, batch_size,
+                               frame_stride, start_time, end_time, prefetch_depth,
+                               jpeg_quality, save_images, save_labels, backend_options)
+    else:
+        # Run batched inference on the folder
+        run_batched_inference_on_folder(model_path, folder_path, confidence_threshold,
+                                        batch_size, num_decoders, prefetch_depth,
+                                        jpeg_quality, save_images, save_labels, tile_options, backend_options,
+                                        dataset_index, shard_dir)
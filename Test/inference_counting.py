@@ -1,6 +1,25 @@
 from ultralytics import YOLO
-import cv2
+import matplotlib.pyplot as plt
+import multiprocessing
+import numpy as np
 import os
+import sys
+import time
+import torch
+from concurrent.futures import ProcessPoolExecutor
+
+from backends import load_model, prepare_worker_backend
+from detection_cache import CACHE_CONFIDENCE_FLOOR, DetectionCache, detections_to_result, hash_files, result_to_detections
+from pipeline import list_images, predict_in_batches, prefetch_folder
+from result_writer import ResultWriter
+from tiling import new_tiling_stats, predict_tiled, print_tiling_stats
+
+# The label store lives with the preprocessing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from label_store import LabelStore
+
+# Options passed to model.predict on top of the confidence threshold, also part of the detection cache key
+PREDICT_OPTIONS = {'imgsz': 640, 'iou': 0.7}
 
 # Function to extract fold number and model name from model path
 def extract_info_from_model_path(model_path):
@@ -10,93 +29,139 @@ def extract_info_from_model_path(model_path):
     model_name = os.path.splitext(os.path.basename(model_path))[0]  # Removes the '.pt' extension
     return fold_number, model_name
 
-# Function to count bounding boxes from label file
-def count_bounding_boxes_from_label(label_file_path):
-    if not os.path.exists(label_file_path):
-        print(f"Label file {label_file_path} not found.")
+# Function to get the ground truth box count of an image from the label store
+def count_bounding_boxes_from_label(label_store, image_file):
+    box_count = label_store.box_count(image_file)
+    if box_count is None:
+        print(f"Label file for {image_file} not found.")
         return 0
-    
-    # Count lines in the label file (each line represents a bounding box)
-    with open(label_file_path, 'r') as label_file:
-        return len(label_file.readlines())
+    return box_count
 
-# Function to perform inference on a folder of images
-def run_inference_on_folder(model_path, folder_path, labels_folder_path, confidence_threshold=0.25):
-    # Load the YOLOv8 model
-    model = YOLO(model_path)
+# Function to detect the boxes of a list of images, returning (image_file, detections) records
+def count_images(model, image_files, folder_path, detection_threshold, confidence_threshold, writer, fold_number,
+                 model_name, tile_options=None, tiling_stats=None, predict_options=PREDICT_OPTIONS):
+    # Images are decoded ahead of the model by the prefetch threads, unreadable files are reported and skipped
+    decoded_images = prefetch_folder(folder_path, image_files=image_files)
 
-    # Extract fold number and model name from model path
-    fold_number, model_name = extract_info_from_model_path(model_path)
+    # Perform inference, on overlapping tiles in tiled mode. The detection threshold is lower than the
+    # confidence threshold when the raw detections are cached
+    if tile_options:
+        predictions = predict_tiled(model, decoded_images, 1, detection_threshold, stats=tiling_stats,
+                                    predict_options=predict_options, **tile_options)
+    else:
+        predictions = predict_in_batches(model, decoded_images, 1, detection_threshold, **predict_options)
 
-    # Define directory to save the inference results
-    save_dir = 'InferenceResults/Small300_best5'
-    os.makedirs(save_dir, exist_ok=True)
+    records = []
+    for image_file, result in predictions:
+        # Keep the boxes as normalised (x1, y1, x2, y2, confidence, class) rows
+        records.append((image_file, result_to_detections(result)))
 
-    # Define file to save the results
-    results_file_path = os.path.join(save_dir, 'results.txt')
-    
-    # Open file for writing results
-    with open(results_file_path, 'w') as results_file:
-        total_confidence_sum = 0.0
-        total_boxes_count = 0
-        total_actual_bboxes = 0
-        image_counter = 1
+        # Save the result with bounding boxes as an image, using the required name format
+        writer.submit(result[result.boxes.conf >= confidence_threshold],
+                      f'{image_file}_{fold_number}_{model_name}_{confidence_threshold:.2f}')
 
-        # Loop through all images in the folder
-        for image_file in os.listdir(folder_path):
-            # Only process files with common image extensions
-            if image_file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-                image_path = os.path.join(folder_path, image_file)
-                img = cv2.imread(image_path)
+    return records
 
-                if img is None:
-                    print(f"Image at {image_path} not found or unable to open.")
-                    continue
+# Function to process one shard of the image list in a worker process, loading the model once
+def count_images_in_shard(model_path, image_files, folder_path, detection_threshold, confidence_threshold,
+                          save_dir, writer_options, num_threads, tile_options=None, backend_options=None,
+                          predict_options=PREDICT_OPTIONS):
+    # Split the CPU cores between the worker processes instead of letting each one use all of them
+    torch.set_num_threads(num_threads)
 
-                # Perform inference with the confidence threshold
-                results = model.predict(source=image_path, conf=confidence_threshold)
+    model = load_model(model_path, **(backend_options or {}))
+    fold_number, model_name = extract_info_from_model_path(model_path)
+    tiling_stats = new_tiling_stats()
+    with ResultWriter(save_dir, **writer_options) as writer:
+        records = count_images(model, image_files, folder_path, detection_threshold, confidence_threshold,
+                               writer, fold_number, model_name, tile_options, tiling_stats, predict_options)
+    return records, tiling_stats
 
-                # Get the confidence values for each bounding box
-                confidence_values = [box.conf.item() for box in results[0].boxes]
+# Function to run the detector over a list of images, serially or split across worker processes
+def detect_images(model_path, image_files, folder_path, detection_threshold, confidence_threshold, save_dir,
+                  writer_options, workers=1, tile_options=None, backend_options=None, tiling_stats=None,
+                  predict_options=PREDICT_OPTIONS):
+    if not image_files:
+        return []
 
-                # Sum of confidences and count of boxes for this image
-                image_confidence_sum = sum(confidence_values)
-                image_boxes_count = len(confidence_values)
+    if workers > 1:
+        # Contiguous shards keep the merged records in the same order as the serial run
+        num_images = len(image_files)
+        shards = [image_files[i * num_images // workers:(i + 1) * num_images // workers] for i in range(workers)]
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
 
-                # Update total sums
-                total_confidence_sum += image_confidence_sum
-                total_boxes_count += image_boxes_count
+        # Export once here, so the workers load the finished file instead of all exporting it at the same time
+        backend_options = prepare_worker_backend(model_path, backend_options)
 
-                # Calculate the average confidence for this image
-                image_avg_confidence = image_confidence_sum / image_boxes_count if image_boxes_count > 0 else 0
+        # Spawned processes do not inherit the parent's torch thread pools
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(count_images_in_shard, model_path, shard, folder_path, detection_threshold,
+                                confidence_threshold, save_dir, writer_options, num_threads, tile_options,
+                                backend_options, predict_options)
+                for shard in shards
+            ]
+            records = []
+            for future in futures:
+                shard_records, shard_stats = future.result()
+                records.extend(shard_records)
+                if tiling_stats is not None:
+                    for key in tiling_stats:
+                        tiling_stats[key] += shard_stats[key]
+        return records
 
-                # Get corresponding label file
-                image_name, ext = os.path.splitext(image_file)
-                label_file_path = os.path.join(labels_folder_path, f'{image_name}.txt')
+    # Load the YOLOv8 model, exported to ONNX/OpenVINO when a CPU backend is requested
+    model = load_model(model_path, **(backend_options or {}))
 
-                # Get actual bounding box count from the label file (ground truth)
-                actual_bboxes_count = count_bounding_boxes_from_label(label_file_path)
-                total_actual_bboxes += actual_bboxes_count
+    # Extract fold number and model name from model path
+    fold_number, model_name = extract_info_from_model_path(model_path)
 
-                # Write results for this image to the file
-                results_file.write(f"Image {image_counter}: {image_file}\n")  # Write image name
-                results_file.write(f"Box recognised: {image_boxes_count}\n")
-                results_file.write(f"Ground truth Box: {actual_bboxes_count}\n")  # Write ground truth box count
-                results_file.write(f"Average confidence: {image_avg_confidence:.2f}\n\n")
+    # Annotated images and labels are written by the writer threads
+    with ResultWriter(save_dir, **writer_options) as writer:
+        return count_images(model, image_files, folder_path, detection_threshold, confidence_threshold,
+                            writer, fold_number, model_name, tile_options, tiling_stats, predict_options)
 
-                image_counter += 1
+# Function to render the images whose detections came from the cache, so the outputs match an uncached run
+def write_cached_results(model_path, image_files, folder_path, detections_by_image, confidence_threshold, save_dir,
+                         writer_options):
+    if not image_files or not (writer_options['save_images'] or writer_options['save_labels']):
+        return
+    class_names = YOLO(model_path).names
+    fold_number, model_name = extract_info_from_model_path(model_path)
+    with ResultWriter(save_dir, **writer_options) as writer:
+        for image_file, image in prefetch_folder(folder_path, image_files=image_files):
+            result = detections_to_result(image, image_file, detections_by_image[image_file], class_names,
+                                          confidence_threshold)
+            writer.submit(result, f'{image_file}_{fold_number}_{model_name}_{confidence_threshold:.2f}')
+
+# Function to write the per-image records and the summary to the results file
+def write_results_file(records, results_file_path, confidence_threshold):
+    with open(results_file_path, 'w') as results_file:
+        total_confidence_sum = 0.0
+        total_boxes_count = 0
+        total_actual_bboxes = 0
+
+        for image_counter, (image_file, detections, actual_bboxes_count) in enumerate(records, 1):
+            # Get the confidence values for each bounding box above the threshold
+            confidence_values = detections[detections[:, 4] >= confidence_threshold, 4].tolist()
+
+            # Sum of confidences and count of boxes for this image
+            image_confidence_sum = sum(confidence_values)
+            image_boxes_count = len(confidence_values)
+
+            # Update total sums
+            total_confidence_sum += image_confidence_sum
+            total_boxes_count += image_boxes_count
+            total_actual_bboxes += actual_bboxes_count
 
-            # Save the results with bounding boxes as images
-            for idx, result in enumerate(results):
-                # Plot bounding boxes on the image
-                result_image = result.plot()
+            # Calculate the average confidence for this image
+            image_avg_confidence = image_confidence_sum / image_boxes_count if image_boxes_count > 0 else 0
 
-                # Define the save path using the required format
-                save_path = os.path.join(
-                    save_dir, 
-                    f'{image_file}_{fold_number}_{model_name}_{confidence_threshold:.2f}.jpg'
-                )
-                cv2.imwrite(save_path, result_image)
+            # Write results for this image to the file
+            results_file.write(f"Image {image_counter}: {image_file}\n")  # Write image name
+            results_file.write(f"Box recognised: {image_boxes_count}\n")
+            results_file.write(f"Ground truth Box: {actual_bboxes_count}\n")  # Write ground truth box count
+            results_file.write(f"Average confidence: {image_avg_confidence:.2f}\n\n")
 
         # Calculate overall average confidence across all images
         overall_avg_confidence = total_confidence_sum / total_boxes_count if total_boxes_count > 0 else 0
@@ -107,8 +172,210 @@ def run_inference_on_folder(model_path, folder_path, labels_folder_path, confide
         results_file.write(f"Total Ground truth Box: {total_actual_bboxes}\n")  # Total actual boxes
         results_file.write(f"Overall Average Confidence: {overall_avg_confidence:.2f}\n")
 
+# Function to get the detections of every image, from the cache when enabled, as (image_file, detections) records
+def collect_detections(model_path, image_files, folder_path, confidence_threshold, save_dir, writer_options, workers=1,
+                       tile_options=None, backend_options=None, cache_dir=None, detection_threshold=None,
+                       predict_options=None):
+    # Without a cache the model runs at the confidence threshold unless a lower detection threshold is requested
+    if detection_threshold is None:
+        detection_threshold = confidence_threshold
+
+    predict_options = {**PREDICT_OPTIONS, **(predict_options or {})}
+
+    start_time = time.perf_counter()
+    tiling_stats = new_tiling_stats()
+    if cache_dir:
+        # Raw detections are cached at a low floor, keyed by image content, checkpoint and the exact options the
+        # model runs with, so a run with another image size, IoU, tiling or backend never reuses stale detections
+        settings = {'predict_options': predict_options, 'confidence_floor': CACHE_CONFIDENCE_FLOOR,
+                    'tile_options': tile_options, 'backend_options': backend_options}
+        cache = DetectionCache(cache_dir, model_path, settings)
+        image_hashes = hash_files(folder_path, image_files)
+        missing_files = [f for f in image_files if cache.get(image_hashes[f]) is None]
+        print(f"Detection cache: {len(image_files) - len(missing_files)} cached, {len(missing_files)} to process")
+
+        # Only the images missing from the cache go through the model
+        for image_file, detections in detect_images(model_path, missing_files, folder_path, CACHE_CONFIDENCE_FLOOR,
+                                                    confidence_threshold, save_dir, writer_options, workers,
+                                                    tile_options, backend_options, tiling_stats, predict_options):
+            cache.put(image_hashes[image_file], detections)
+        cache.flush()
+
+        # Thresholds are applied in post-processing, images that could not be decoded are left out
+        detections_by_image = {f: cache.get(image_hashes[f]) for f in image_files}
+        detection_records = [(f, d) for f, d in detections_by_image.items() if d is not None]
+        missing_set = set(missing_files)
+        cached_files = [f for f, _ in detection_records if f not in missing_set]
+        write_cached_results(model_path, cached_files, folder_path, detections_by_image, confidence_threshold,
+                             save_dir, writer_options)
+    else:
+        detection_records = detect_images(model_path, image_files, folder_path, detection_threshold,
+                                          confidence_threshold, save_dir, writer_options, workers, tile_options,
+                                          backend_options, tiling_stats, predict_options)
+
+    if tile_options:
+        print_tiling_stats(tiling_stats, tile_options.get('tile_size', 640), tile_options.get('overlap', 0.2),
+                           time.perf_counter() - start_time)
+    return detection_records
+
+# Function to perform inference on a folder of images
+def run_inference_on_folder(model_path, folder_path, labels_folder_path, confidence_threshold=0.25,
+                            jpeg_quality=95, save_images=True, save_labels=False, workers=1, tile_options=None,
+                            backend_options=None, cache_dir=None, dataset_index=None):
+    # Define directory to save the inference results
+    save_dir = 'InferenceResults/Small300_best5'
+    os.makedirs(save_dir, exist_ok=True)
+
+    # Define file to save the results
+    results_file_path = os.path.join(save_dir, 'results.txt')
+
+    # Images are processed in name order, so serial and sharded runs produce the same results file
+    image_files = list_images(folder_path, dataset_index)
+    writer_options = {'jpeg_quality': jpeg_quality, 'save_images': save_images, 'save_labels': save_labels}
+
+    detection_records = collect_detections(model_path, image_files, folder_path, confidence_threshold, save_dir,
+                                           writer_options, workers, tile_options, backend_options, cache_dir)
+
+    # Get actual bounding box count (ground truth) of every processed image, the store only re-reads changed labels
+    label_store = LabelStore(labels_folder_path)
+    records = []
+    for image_file, detections in detection_records:
+        records.append((image_file, detections, count_bounding_boxes_from_label(label_store, image_file)))
+
+    write_results_file(records, results_file_path, confidence_threshold)
     print(f"Results saved to: {results_file_path}")
 
+# Function to get the ground truth boxes of an image from the label store as normalised (x1, y1, x2, y2) rows
+def load_label_boxes(label_store, image_file):
+    labels = label_store.boxes(image_file)
+    if labels is None:
+        return np.zeros((0, 4), dtype=np.float32)
+    x_center, y_center, width, height = labels[:, 1], labels[:, 2], labels[:, 3], labels[:, 4]
+    return np.column_stack([x_center - width / 2, y_center - height / 2, x_center + width / 2, y_center + height / 2])
+
+# Function to flag the detections matching a ground truth box, matching greedily by decreasing confidence
+def match_detections(detections, gt_boxes, iou_threshold=0.5):
+    true_positives = np.zeros(len(detections), dtype=bool)
+    if len(detections) == 0 or len(gt_boxes) == 0:
+        return true_positives
+
+    # Pairwise IoU between all detections and all ground truth boxes
+    boxes = detections[:, :4]
+    inter_w = np.clip(np.minimum(boxes[:, None, 2], gt_boxes[None, :, 2]) - np.maximum(boxes[:, None, 0], gt_boxes[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(boxes[:, None, 3], gt_boxes[None, :, 3]) - np.maximum(boxes[:, None, 1], gt_boxes[None, :, 1]), 0, None)
+    intersection = inter_w * inter_h
+    box_areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    gt_areas = (gt_boxes[:, 2] - gt_boxes[:, 0]) * (gt_boxes[:, 3] - gt_boxes[:, 1])
+    ious = intersection / (box_areas[:, None] + gt_areas[None, :] - intersection + 1e-9)
+
+    # Matching in confidence order makes the matches above any threshold a prefix of this matching
+    matched = np.zeros(len(gt_boxes), dtype=bool)
+    for i in np.argsort(-detections[:, 4], kind='stable'):
+        candidate_ious = np.where(matched, 0.0, ious[i])
+        best = int(np.argmax(candidate_ious))
+        if candidate_ious[best] >= iou_threshold:
+            matched[best] = True
+            true_positives[i] = True
+    return true_positives
+
+# Function to compute the counting and detection metrics of every threshold at once over all detections
+def compute_threshold_sweep(image_ids, confidences, true_positives, gt_counts, thresholds):
+    num_images = len(gt_counts)
+    confidences = confidences.astype(np.float64)
+
+    # Keys 2 * image + confidence sort detections by image then confidence, so the detections of image i
+    # above a threshold t are the keys between 2i + t and 2i + 1
+    keys = np.sort(2.0 * image_ids + confidences)
+    image_starts = 2.0 * np.arange(num_images)
+    lower = np.searchsorted(keys, (image_starts[:, None] + thresholds[None, :]).ravel(), side='left')
+    upper = np.searchsorted(keys, image_starts + 1.0, side='right')
+    predicted_counts = upper[:, None] - lower.reshape(num_images, len(thresholds))
+
+    # Without images the errors are 0 rather than the NaN mean of an empty array
+    count_errors = predicted_counts - gt_counts[:, None]
+    count_mae = np.abs(count_errors).mean(axis=0) if num_images else np.zeros(len(thresholds))
+    count_rmse = np.sqrt((count_errors ** 2).mean(axis=0)) if num_images else np.zeros(len(thresholds))
+
+    # True positives above each threshold from the cumulative sum in decreasing confidence order
+    order = np.argsort(-confidences, kind='stable')
+    cumulative_tp = np.concatenate([[0], np.cumsum(true_positives[order])])
+    num_predicted = len(confidences) - np.searchsorted(np.sort(confidences), thresholds, side='left')
+    tp_counts = cumulative_tp[num_predicted]
+    precision = np.divide(tp_counts, num_predicted, out=np.zeros(len(thresholds)), where=num_predicted > 0)
+    recall = tp_counts / gt_counts.sum() if gt_counts.sum() > 0 else np.zeros(len(thresholds))
+
+    return {
+        'threshold': thresholds,
+        'predicted_count': predicted_counts.sum(axis=0),
+        'ground_truth_count': np.full(len(thresholds), gt_counts.sum()),
+        'count_mae': count_mae,
+        'count_rmse': count_rmse,
+        'precision': precision,
+        'recall': recall,
+    }
+
+# Function to evaluate a grid of confidence thresholds from a single model pass at a low floor
+def run_threshold_sweep(model_path, folder_path, labels_folder_path, thresholds=None, match_iou=0.5, workers=1,
+                        tile_options=None, backend_options=None, cache_dir=None, dataset_index=None):
+    if thresholds is None:
+        thresholds = np.round(np.arange(0.05, 0.96, 0.05), 2)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    # Define directory to save the sweep results
+    save_dir = 'InferenceResults/Small300_best5'
+    os.makedirs(save_dir, exist_ok=True)
+
+    # One pass at the cache floor, without writing annotated images
+    image_files = list_images(folder_path, dataset_index)
+    writer_options = {'jpeg_quality': 95, 'save_images': False, 'save_labels': False}
+    detection_records = collect_detections(model_path, image_files, folder_path, CACHE_CONFIDENCE_FLOOR, save_dir,
+                                           writer_options, workers, tile_options, backend_options, cache_dir,
+                                           detection_threshold=CACHE_CONFIDENCE_FLOOR)
+    if not detection_records:
+        print(f"No readable images in {folder_path}, nothing to sweep")
+        return None
+
+    # Flatten all detections with their image index and match flag
+    label_store = LabelStore(labels_folder_path)
+    image_ids, confidences, true_positives, gt_counts = [], [], [], []
+    for image_index, (image_file, detections) in enumerate(detection_records):
+        gt_boxes = load_label_boxes(label_store, image_file)
+        image_ids.append(np.full(len(detections), image_index))
+        confidences.append(detections[:, 4])
+        true_positives.append(match_detections(detections, gt_boxes, match_iou))
+        gt_counts.append(len(gt_boxes))
+
+    sweep = compute_threshold_sweep(np.concatenate(image_ids + [np.zeros(0)]), np.concatenate(confidences + [np.zeros(0)]),
+                                    np.concatenate(true_positives + [np.zeros(0, dtype=bool)]), np.array(gt_counts),
+                                    thresholds)
+
+    # Write the table
+    table_path = os.path.join(save_dir, 'threshold_sweep.csv')
+    with open(table_path, 'w') as table_file:
+        table_file.write(','.join(sweep) + '\n')
+        for row in zip(*sweep.values()):
+            table_file.write(','.join(f'{value:.4f}' if isinstance(value, float) else str(value) for value in row) + '\n')
+
+    # Plot the counting error and the precision/recall curves
+    figure, (count_axis, pr_axis) = plt.subplots(1, 2, figsize=(14, 5))
+    count_axis.plot(thresholds, sweep['count_mae'], label='Count MAE')
+    count_axis.plot(thresholds, sweep['count_rmse'], label='Count RMSE')
+    count_axis.set_xlabel('Confidence threshold')
+    count_axis.set_ylabel('Boxes per image')
+    count_axis.legend()
+    pr_axis.plot(thresholds, sweep['precision'], label='Precision')
+    pr_axis.plot(thresholds, sweep['recall'], label='Recall')
+    pr_axis.set_xlabel('Confidence threshold')
+    pr_axis.legend()
+    plot_path = os.path.join(save_dir, 'threshold_sweep.png')
+    figure.savefig(plot_path)
+    plt.close(figure)
+
+    best = int(np.argmin(sweep['count_mae']))
+    print(f"Best threshold for counting: {thresholds[best]:.2f} (count MAE = {sweep['count_mae'][best]:.3f})")
+    print(f"Sweep saved to: {table_path} and {plot_path}")
+    return sweep
+
 if __name__ == '__main__':
     # Path to the trained model (e.g., best.pt)
     model_path = '/Users/emsar/OneDrive/Desktop/materiale progetto cv/resultsv8Small300/epoche/fold 5/best.pt'
@@ -122,5 +389,36 @@ if __name__ == '__main__':
     # Confidence threshold
     confidence_threshold = 0.5
 
-    # Run inference on the folder
-    run_inference_on_folder(model_path, folder_path, labels_folder_path, confidence_threshold)
+    # Output options: JPEG quality of the annotated images, whether to render them and whether to write YOLO .txt predictions
+    jpeg_quality = 90
+    save_images = True
+    save_labels = False
+
+    # Number of worker processes the image list is split across (1 runs serially in this process)
+    workers = 1
+
+    # Tiled inference for small, distant fish: overlapping tiles at native resolution (None to resize whole frames)
+    tile_options = None  # e.g. {'tile_size': 640, 'overlap': 0.2, 'min_std': 8.0}
+
+    # Inference backend: PyTorch by default, or an ONNX/OpenVINO export (optionally INT8) cached next to the .pt
+    backend_options = None  # e.g. {'backend': 'openvino', 'int8': True, 'calibration_folder': folder_path}
+
+    # Folder caching raw detections between runs, so changing the threshold does not re-run the model
+    # (None to disable; images and checkpoint are hashed and the model runs at the cache confidence floor)
+    cache_dir = None  # e.g. 'InferenceResults/detection_cache'
+
+    # Evaluate a grid of thresholds from a single model pass instead of a single threshold
+    sweep_thresholds = False
+
+    # Dataset index used as the image list instead of listing the folder (Preprocessing/dataset_index.py, None to list)
+    dataset_index = None
+
+    if sweep_thresholds:
+        # Run the threshold sweep on the folder
+        run_threshold_sweep(model_path, folder_path, labels_folder_path, workers=workers, tile_options=tile_options,
+                            backend_options=backend_options, cache_dir=cache_dir, dataset_index=dataset_index)
+    else:
+        # Run inference on the folder
+        run_inference_on_folder(model_path, folder_path, labels_folder_path, confidence_threshold,
+                                jpeg_quality, save_images, save_labels, workers, tile_options, backend_options, cache_dir,
+                                dataset_index)
@@ -0,0 +1,273 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from backends import load_model
+from pipeline import list_images
+
+# A single inference request waiting in a model queue
+class PendingRequest:
+    def __init__(self, image, confidence_threshold):
+        self.image = image
+        self.confidence_threshold = confidence_threshold
+        self.arrival_time = time.perf_counter()
+        self.done = threading.Event()
+        self.detections = None
+        self.error = None
+
+# Latency, batch size and request counters exposed on /metrics
+class ServerMetrics:
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=window)
+        self._batch_sizes = Counter()
+        self.requests = 0
+        self.errors = 0
+
+    def record_batch(self, batch_size):
+        with self._lock:
+            self._batch_sizes[batch_size] += 1
+
+    def record_request(self, latency_ms, failed=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(failed)
+            self._latencies_ms.append(latency_ms)
+
+    def snapshot(self, queue_depths):
+        with self._lock:
+            latencies = np.array(self._latencies_ms, dtype=np.float64)
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            requests, errors = self.requests, self.errors
+        percentiles = {}
+        if len(latencies):
+            for p in (50, 90, 95, 99):
+                percentiles[f'p{p}'] = round(float(np.percentile(latencies, p)), 2)
+        return {
+            'requests': requests,
+            'errors': errors,
+            'latency_ms': percentiles,
+            'batch_size_histogram': {str(size): count for size, count in batch_sizes.items()},
+            'queue_depth': queue_depths,
+        }
+
+# Function to convert a result into JSON-serialisable detections above a threshold
+def result_to_json(result, confidence_threshold):
+    boxes = result.boxes.cpu()
+    detections = []
+    for xyxy, conf, cls in zip(boxes.xyxy.tolist(), boxes.conf.tolist(), boxes.cls.tolist()):
+        if conf >= confidence_threshold:
+            detections.append({'box': [round(v, 1) for v in xyxy], 'confidence': round(conf, 4),
+                               'class': int(cls), 'name': result.names[int(cls)]})
+    return detections
+
+# Keeps one model warm and coalesces concurrent requests into micro-batches
+class MicroBatcher:
+    def __init__(self, model, metrics, max_batch_size=16, max_latency_ms=10):
+        self.model = model
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Function to queue an image and wait for its detections
+    def predict(self, image, confidence_threshold):
+        request = PendingRequest(image, confidence_threshold)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.detections
+
+    def _collect_batch(self):
+        # The first request opens the batch, later ones join until it is full or its deadline is reached
+        batch = [self.queue.get()]
+        deadline = batch[0].arrival_time + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self.metrics.record_batch(len(batch))
+            try:
+                # Run at the lowest requested threshold, each request is filtered to its own afterwards
+                floor = min(request.confidence_threshold for request in batch)
+                results = self.model.predict(source=[request.image for request in batch], conf=floor, verbose=False)
+                for request, result in zip(batch, results):
+                    request.detections = result_to_json(result, request.confidence_threshold)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
+
+# HTTP handler: POST /predict?model=<name>&conf=<threshold> with an encoded image body, GET /metrics, GET /health
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'FishDetectionServer/1.0'
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/metrics':
+            queue_depths = {name: batcher.queue.qsize() for name, batcher in self.server.batchers.items()}
+            self._send_json(200, self.server.metrics.snapshot(queue_depths))
+        elif path == '/health':
+            self._send_json(200, {'models': list(self.server.batchers)})
+        else:
+            self._send_json(404, {'error': f'Unknown path {path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/predict':
+            self._send_json(404, {'error': f'Unknown path {url.path}'})
+            return
+
+        start_time = time.perf_counter()
+        params = parse_qs(url.query)
+        model_name = params.get('model', [next(iter(self.server.batchers))])[0]
+        conf = params.get('conf', ['0.25'])[0]
+        try:
+            confidence_threshold = float(conf)
+        except ValueError:
+            confidence_threshold = None
+        if confidence_threshold is None or not 0 <= confidence_threshold <= 1:
+            self._send_json(400, {'error': f'Confidence threshold {conf!r} is not a number between 0 and 1'})
+            return
+        batcher = self.server.batchers.get(model_name)
+        if batcher is None:
+            self._send_json(404, {'error': f'Unknown model {model_name}'})
+            return
+
+        # An empty, missing or malformed length is rejected before reading the body
+        content_length = self.headers.get('Content-Length', '0')
+        try:
+            body_size = int(content_length)
+        except ValueError:
+            body_size = None
+        if body_size is None or body_size <= 0:
+            self._send_json(400, {'error': f'Content-Length {content_length!r} is not a positive integer'})
+            return
+
+        body = self.rfile.read(body_size)
+        image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            self._send_json(400, {'error': 'Request body is not a decodable image'})
+            return
+
+        try:
+            detections = batcher.predict(image, confidence_threshold)
+        except Exception as e:
+            self.server.metrics.record_request(1000 * (time.perf_counter() - start_time), failed=True)
+            self._send_json(500, {'error': str(e)})
+            return
+
+        latency_ms = 1000 * (time.perf_counter() - start_time)
+        self.server.metrics.record_request(latency_ms)
+        self._send_json(200, {'model': model_name, 'detections': detections, 'latency_ms': round(latency_ms, 2)})
+
+    def address_string(self):
+        # Unix socket clients have no host/port
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        # Per-request logs would dominate at high request rates, /metrics reports the aggregates
+        pass
+
+# HTTP server listening on a Unix socket instead of a TCP port
+class UnixSocketHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socket.socket.bind(self.socket, self.server_address)
+        self.server_name, self.server_port = 'localhost', 0
+
+# Function to load and warm up the fold models, then serve requests until interrupted
+def serve(model_paths, host='127.0.0.1', port=8000, unix_socket=None, max_batch_size=16, max_latency_ms=10,
+          backend_options=None):
+    metrics = ServerMetrics()
+    batchers = {}
+    for name, model_path in model_paths.items():
+        model = load_model(model_path, **(backend_options or {}))
+
+        # The first predict call builds the predictor, so it is paid before the first request
+        model.predict(source=np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+        batchers[name] = MicroBatcher(model, metrics, max_batch_size, max_latency_ms)
+        print(f"Model '{name}' loaded from {model_path}")
+
+    if unix_socket:
+        server = UnixSocketHTTPServer(unix_socket, InferenceRequestHandler)
+        print(f"Serving on unix socket {unix_socket}")
+    else:
+        server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+        print(f"Serving on http://{host}:{port}")
+    server.daemon_threads = True
+    server.batchers = batchers
+    server.metrics = metrics
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Server stopped.")
+    finally:
+        server.server_close()
+
+# Function to send every image of a folder to a running server, with concurrent requests so they can be batched
+def predict_folder_via_server(server_url, folder_path, model_name=None, confidence_threshold=0.25, concurrency=8):
+    query = f'conf={confidence_threshold}' + (f'&model={model_name}' if model_name else '')
+
+    def post(image_file):
+        with open(os.path.join(folder_path, image_file), 'rb') as f:
+            request = urllib.request.Request(f'{server_url}/predict?{query}', data=f.read(), method='POST')
+        with urllib.request.urlopen(request) as response:
+            return image_file, json.loads(response.read())
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return dict(executor.map(post, list_images(folder_path)))
+
+if __name__ == '__main__':
+    # Fold models kept warm by the server, addressed by name in the 'model' query parameter
+    model_paths = {
+        f'fold{i}': f'/Users/emsar/OneDrive/Desktop/materiale progetto cv/resultsv8Small300/epoche/fold {i}/best.pt'
+        for i in range(1, 6)
+    }
+
+    # Largest micro-batch and longest time the first request of a batch waits for others to join
+    max_batch_size = 16
+    max_latency_ms = 10
+
+    # Listen on a TCP port, or on a Unix socket when a path is given
+    unix_socket = None
+
+    # Start the server
+    serve(model_paths, port=8000, unix_socket=unix_socket, max_batch_size=max_batch_size,
+          max_latency_ms=max_latency_ms)
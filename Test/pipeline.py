@@ -0,0 +1,147 @@
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# The image extensions are shared with the preprocessing scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from dataset_files import is_image_file
+
+# Function to list the images of a folder in a deterministic order, from a DatasetIndex when one is given
+def list_images(folder_path, dataset_index=None):
+    if dataset_index is not None:
+        return dataset_index.image_files(folder_path)
+    return sorted(f for f in os.listdir(folder_path) if is_image_file(f))
+
+# Function to put an item in a bounded queue without blocking forever once the consumer has stopped
+def _put_until_stopped(target_queue, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            target_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# Function to decode images on a thread pool and yield them in order through a bounded queue
+def prefetch_images(image_paths, num_decoders=4, prefetch_depth=32):
+    # The queue holds futures, so at most 'prefetch_depth' decoded images wait in memory
+    pending = queue.Queue(maxsize=prefetch_depth)
+    stop_event = threading.Event()
+
+    def feed(executor):
+        try:
+            for image_path in image_paths:
+                future = executor.submit(cv2.imread, image_path)
+                if not _put_until_stopped(pending, (image_path, future), stop_event):
+                    return
+        except Exception as e:
+            # Passed to the consumer and raised there, instead of ending the stream early
+            _put_until_stopped(pending, e, stop_event)
+            return
+        _put_until_stopped(pending, None, stop_event)
+
+    with ThreadPoolExecutor(max_workers=num_decoders) as executor:
+        feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+        feeder.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                # A decoder error is raised by result(), an unreadable image only decodes to None
+                image_path, future = item
+                yield image_path, future.result()
+        finally:
+            # Stop the feeder if the consumer exits early (e.g. on error)
+            stop_event.set()
+            feeder.join()
+
+# Function to prefetch the images of a folder, yielding (image_file, image) and skipping files that cannot be decoded
+def prefetch_folder(folder_path, num_decoders=4, prefetch_depth=32, image_files=None):
+    if image_files is None:
+        image_files = list_images(folder_path)
+    image_paths = [os.path.join(folder_path, f) for f in image_files]
+    for image_path, img in prefetch_images(image_paths, num_decoders, prefetch_depth):
+        if img is None:
+            print(f"Image at {image_path} not found or unable to open.")
+            continue
+        yield os.path.basename(image_path), img
+
+# Function to read frames of a video file or stream on a producer thread, yielding (frame_index, timestamp, frame)
+def read_video_frames(video_source, frame_stride=1, start_time=None, end_time=None, prefetch_depth=32):
+    capture = cv2.VideoCapture(video_source)
+    if not capture.isOpened():
+        raise ValueError(f"Video source {video_source} cannot be opened.")
+
+    # Streams may not report a frame rate, in which case the decoder timestamps are used
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    frames = queue.Queue(maxsize=prefetch_depth)
+    stop_event = threading.Event()
+
+    def produce():
+        try:
+            frame_index = 0
+
+            # Seek to the start of the time range when the container supports it
+            if start_time and fps > 0 and capture.set(cv2.CAP_PROP_POS_FRAMES, int(start_time * fps)):
+                frame_index = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+
+            while not stop_event.is_set():
+                # grab() only demuxes the frame, the pixel conversion is paid for kept frames only
+                if not capture.grab():
+                    break
+                timestamp = frame_index / fps if fps > 0 else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+                if end_time is not None and timestamp > end_time:
+                    break
+                keep = (start_time is None or timestamp >= start_time) and frame_index % frame_stride == 0
+                if keep:
+                    retrieved, frame = capture.retrieve()
+                    if retrieved and not _put_until_stopped(frames, (frame_index, timestamp, frame), stop_event):
+                        break
+                frame_index += 1
+        except Exception as e:
+            # Passed to the consumer and raised there, instead of ending the stream early
+            _put_until_stopped(frames, e, stop_event)
+        finally:
+            capture.release()
+            _put_until_stopped(frames, None, stop_event)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
+
+# Function to group an iterable into lists of at most 'batch_size' items
+def batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Function to run the model on batches of already decoded images, yielding (name, result) pairs
+def predict_in_batches(model, named_images, batch_size, confidence_threshold, **predict_options):
+    for batch in batched(named_images, batch_size):
+        names = [name for name, _ in batch]
+        images = [image for _, image in batch]
+        results = model.predict(source=images, conf=confidence_threshold, verbose=False, **predict_options)
+        yield from zip(names, results)
@@ -0,0 +1,74 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# Function to format the boxes of a result as YOLO label lines (class x_center y_center width height confidence)
+def result_to_yolo_lines(result):
+    boxes = result.boxes.cpu()
+    lines = []
+    for cls, xywhn, conf in zip(boxes.cls.tolist(), boxes.xywhn.tolist(), boxes.conf.tolist()):
+        x_center, y_center, width, height = xywhn
+        lines.append(f"{int(cls)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f} {conf:.4f}\n")
+    return lines
+
+# Writer stage that renders and saves results on a thread pool, off the inference thread
+class ResultWriter:
+    def __init__(self, save_dir, num_threads=2, max_pending=32, jpeg_quality=95,
+                 save_images=True, save_labels=False):
+        self.save_dir = save_dir
+        self.jpeg_quality = jpeg_quality
+        self.save_images = save_images
+        self.save_labels = save_labels
+        os.makedirs(save_dir, exist_ok=True)
+
+        # Each pending result keeps its frame in memory, so submit() blocks once 'max_pending' are queued
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=num_threads)
+        self._errors = []
+
+    # Function to queue a result for writing, blocking while the writer is behind
+    def submit(self, result, file_stem):
+        if not (self.save_images or self.save_labels):
+            return
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, result, file_stem)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        self._slots.release()
+        if future.exception() is not None:
+            self._errors.append(future.exception())
+
+    def _write(self, result, file_stem):
+        if self.save_images:
+            # Plot bounding boxes on the image and encode it with the configured quality
+            result_image = result.plot()
+            save_path = os.path.join(self.save_dir, f'{file_stem}.jpg')
+            cv2.imwrite(save_path, result_image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+
+        if self.save_labels:
+            # Write the predictions in YOLO format, with the confidence as an extra column
+            label_path = os.path.join(self.save_dir, f'{file_stem}.txt')
+            with open(label_path, 'w') as label_file:
+                label_file.writelines(result_to_yolo_lines(result))
+
+    # Function to wait for all pending writes and report the first error, if any
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._errors:
+            raise RuntimeError(f"{len(self._errors)} results could not be written") from self._errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,82 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from box_fusion import class_wise_nms
+from pipeline import batched
+
+# Function to compute the top-left corners of the overlapping tiles covering a frame
+def tile_origins(height, width, tile_size=640, overlap=0.2):
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        # The last tile is aligned with the border so the whole frame is covered
+        return list(range(0, length - tile_size, stride)) + [length - tile_size]
+
+    return [(x, y) for y in starts(height) for x in starts(width)]
+
+# Function to check cheaply whether a tile has enough texture to possibly contain a fish
+def tile_has_content(tile, min_std=8.0):
+    # A subsampled grey level standard deviation is enough to reject open water and black borders
+    return float(tile[::8, ::8].mean(axis=2).std()) >= min_std
+
+# Function to create the counters reported after a tiled run
+def new_tiling_stats():
+    return {'frames': 0, 'tiles': 0, 'skipped_tiles': 0}
+
+# Function to run the model on overlapping tiles of batches of frames, yielding (name, result) with boxes in frame coordinates
+def predict_tiled(model, named_images, batch_size, confidence_threshold, tile_size=640, overlap=0.2, min_std=8.0,
+                  merge_iou=0.5, merge_ios=0.7, stats=None, predict_options=None):
+    # Tiles always go through the model at their native size, whatever image size the other options request
+    predict_options = {key: value for key, value in (predict_options or {}).items() if key != 'imgsz'}
+    for batch in batched(named_images, batch_size):
+        # Cut every frame of the batch into tiles, remembering which frame and offset each tile comes from
+        tiles, tile_origins_in_frame = [], []
+        for frame_index, (_, image) in enumerate(batch):
+            height, width = image.shape[:2]
+            origins = tile_origins(height, width, tile_size, overlap)
+            kept_tiles = 0
+            for x, y in origins:
+                tile = image[y:y + tile_size, x:x + tile_size]
+                if tile_has_content(tile, min_std):
+                    tiles.append(tile)
+                    tile_origins_in_frame.append((frame_index, x, y))
+                    kept_tiles += 1
+            if stats is not None:
+                stats['frames'] += 1
+                stats['tiles'] += len(origins)
+                stats['skipped_tiles'] += len(origins) - kept_tiles
+
+        # All tiles of the batch go through the model in one call, at their native resolution
+        tile_results = model.predict(source=tiles, conf=confidence_threshold, imgsz=tile_size, verbose=False,
+                                     **predict_options) if tiles else []
+
+        detections = [[] for _ in batch]
+        for (frame_index, x, y), result in zip(tile_origins_in_frame, tile_results):
+            boxes = result.boxes.cpu()
+            if len(boxes) == 0:
+                continue
+            xyxy = boxes.xyxy.numpy() + [x, y, x, y]
+            detections[frame_index].append(np.column_stack([xyxy, boxes.conf.numpy(), boxes.cls.numpy()]))
+
+        for (name, image), frame_detections in zip(batch, detections):
+            # Merge the duplicates found by overlapping tiles along the seams
+            if frame_detections:
+                merged = np.concatenate(frame_detections)
+                boxes, scores, classes = class_wise_nms(merged[:, :4], merged[:, 4], merged[:, 5], merge_iou, merge_ios)
+                fused = np.column_stack([boxes, scores, classes]).astype(np.float32)
+            else:
+                fused = np.zeros((0, 6), dtype=np.float32)
+            yield name, Results(orig_img=image, path=name, names=model.names, boxes=torch.from_numpy(fused))
+
+# Function to print the tile counts and throughput of a tiled run
+def print_tiling_stats(stats, tile_size, overlap, elapsed_time):
+    frames = stats['frames']
+    processed_tiles = stats['tiles'] - stats['skipped_tiles']
+    print(f"Tiles of {tile_size} px with {overlap:.0%} overlap: {stats['tiles']} tiles, "
+          f"{stats['skipped_tiles']} skipped below the content threshold, "
+          f"{stats['tiles'] / frames if frames else 0:.1f} tiles/frame")
+    if elapsed_time > 0:
+        print(f"Throughput: {frames / elapsed_time:.2f} frames/s, {processed_tiles / elapsed_time:.2f} tiles/s")
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Test'))
+from detection_cache import DetectionCache
+
+SETTINGS = {'predict_options': {'imgsz': 640, 'iou': 0.7}, 'confidence_floor': 0.001}
+
+
+def make_cache(tmp_path, settings=SETTINGS):
+    model_path = tmp_path / 'best.pt'
+    if not model_path.exists():
+        model_path.write_bytes(b'checkpoint')
+    return DetectionCache(str(tmp_path / 'cache'), str(model_path), settings)
+
+
+def detections(count, confidence=0.5):
+    return np.tile(np.array([[0.1, 0.1, 0.2, 0.2, confidence, 0]], dtype=np.float32), (count, 1))
+
+
+def test_flushed_detections_are_reloaded(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('a' * 40, detections(2))
+    cache.put('b' * 40, detections(0))
+    cache.flush()
+
+    reloaded = make_cache(tmp_path)
+    assert len(reloaded) == 2
+    assert reloaded.get('a' * 40).shape == (2, 6)
+    assert reloaded.get('b' * 40).shape == (0, 6)
+    assert reloaded.get('c' * 40) is None
+
+
+def test_interrupted_flush_is_detected(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('a' * 40, detections(2))
+    cache.flush()
+
+    # A crash after detections and offsets were replaced but before the keys: the files disagree on the image count
+    np.save(os.path.join(cache.cache_dir, 'detections.npy'), detections(5))
+    np.save(os.path.join(cache.cache_dir, 'offsets.npy'), np.array([0, 2, 5], dtype=np.int64))
+
+    reloaded = make_cache(tmp_path)
+    assert len(reloaded) == 0
+    assert reloaded.get('a' * 40) is None
+
+
+def test_other_settings_use_another_folder(tmp_path):
+    cache = make_cache(tmp_path)
+    other = make_cache(tmp_path, {**SETTINGS, 'predict_options': {'imgsz': 1280, 'iou': 0.7}})
+    assert cache.cache_dir != other.cache_dir
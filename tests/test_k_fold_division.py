@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from k_fold_division import MANIFEST_FILE, divide_images_and_texts_into_groups
+
+
+def make_images(folder, names):
+    folder.mkdir(exist_ok=True)
+    for name in names:
+        (folder / f'{name}.jpg').write_bytes(b'jpeg')
+        (folder / f'{name}.txt').write_text('0 0.5 0.5 0.1 0.1\n')
+
+
+def assignments(output_folder):
+    with open(output_folder / MANIFEST_FILE) as f:
+        return json.load(f)['assignments']
+
+
+def fold_files(output_folder, split, subfolder):
+    return {name for fold in range(1, 4)
+            for name in os.listdir(output_folder / f'fold_{fold}' / split / subfolder)}
+
+
+def test_assignments_are_stable_when_images_are_added_or_removed(tmp_path):
+    source, output = tmp_path / 'source', tmp_path / 'folds'
+    make_images(source, [f'image{i}' for i in range(30)])
+    divide_images_and_texts_into_groups(str(source), str(output), num_groups=3)
+    before = assignments(output)
+
+    make_images(source, [f'new{i}' for i in range(10)])
+    os.remove(source / 'image0.jpg')
+    divide_images_and_texts_into_groups(str(source), str(output), num_groups=3)
+    after = assignments(output)
+
+    assert 'image0.jpg' not in after and all(f'new{i}.jpg' in after for i in range(10))
+    assert all(after[image] == fold for image, fold in before.items() if image != 'image0.jpg')
+    assert 'image0.jpg' not in fold_files(output, 'test', 'images')
+    assert 'new0.jpg' in fold_files(output, 'test', 'images')
+
+
+def test_switching_from_list_mode_places_every_image(tmp_path):
+    source, output = tmp_path / 'source', tmp_path / 'folds'
+    make_images(source, [f'image{i}' for i in range(12)])
+    divide_images_and_texts_into_groups(str(source), str(output), num_groups=3, mode='list')
+    assert os.path.exists(output / 'fold_1' / 'training.txt')
+
+    divide_images_and_texts_into_groups(str(source), str(output), num_groups=3, mode='copy')
+    assert not os.path.exists(output / 'fold_1' / 'training.txt')
+    assert len(fold_files(output, 'test', 'images')) == 12
+    assert len(fold_files(output, 'test', 'labels')) == 12
+
+
+def test_edited_and_deleted_labels_are_placed_again(tmp_path):
+    source, output = tmp_path / 'source', tmp_path / 'folds'
+    make_images(source, ['a', 'b'])
+    divide_images_and_texts_into_groups(str(source), str(output), num_groups=3, mode='copy')
+
+    (source / 'a.txt').write_text('0 0.5 0.5 0.1 0.1\n0 0.2 0.2 0.1 0.1\n')
+    os.remove(source / 'b.txt')
+    divide_images_and_texts_into_groups(str(source), str(output), num_groups=3, mode='copy')
+
+    fold = assignments(output)['a.jpg'] + 1
+    assert len((output / f'fold_{fold}' / 'test' / 'labels' / 'a.txt').read_text().splitlines()) == 2
+    assert 'b.txt' not in fold_files(output, 'test', 'labels') | fold_files(output, 'training', 'labels')
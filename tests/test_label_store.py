@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from label_store import LabelStore
+
+
+def test_refresh_reads_only_changed_files(tmp_path, capsys):
+    (tmp_path / 'a.txt').write_text('0 0.5 0.5 0.1 0.1\n')
+    (tmp_path / 'b.txt').write_text('0 0.5 0.5 0.1 0.1\n0 0.2 0.2 0.1 0.1\n')
+    store = LabelStore(str(tmp_path))
+    assert store.boxes_per_image() == {'a.txt': 1, 'b.txt': 2}
+    capsys.readouterr()
+
+    # Reopened without changes: nothing is read again
+    store = LabelStore(str(tmp_path))
+    assert 'refreshed' not in capsys.readouterr().out
+
+    (tmp_path / 'a.txt').write_text('0 0.5 0.5 0.1 0.1\n0 0.3 0.3 0.1 0.1\n0 0.4 0.4 0.1 0.1\n')
+    os.remove(tmp_path / 'b.txt')
+    (tmp_path / 'c.txt').write_text('')
+    store.refresh()
+    assert '2 of 2 label files read' in capsys.readouterr().out
+    assert store.boxes_per_image() == {'a.txt': 3, 'c.txt': 0}
+    assert store.box_count('b.jpg') is None
+
+
+def test_malformed_lines_are_skipped(tmp_path, capsys):
+    (tmp_path / 'a.txt').write_text('0 0.5 0.5 0.1 0.1\n0 0.5 abc\n0 0.2\n0 0.2 0.2 0.1 0.1\n')
+    store = LabelStore(str(tmp_path))
+    assert store.box_count('a.jpg') == 2
+    output = capsys.readouterr().out
+    assert 'line 2 of' in output and 'line 3 of' in output
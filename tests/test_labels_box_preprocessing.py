@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from labels_box_preprocessing import MANIFEST_FILE, convert_labelme_tree
+
+
+def write_labelme(json_path, points):
+    shapes = [{'label': 'sardine', 'shape_type': 'point', 'points': [point]} for point in points]
+    json_path.write_text(json.dumps({'imageWidth': 200, 'imageHeight': 100, 'shapes': shapes}))
+
+
+def label_lines(json_path):
+    return json_path.with_suffix('.txt').read_text().splitlines()
+
+
+def test_converts_new_files_and_records_them(tmp_path):
+    write_labelme(tmp_path / 'a.json', [[50, 50]])
+    convert_labelme_tree(str(tmp_path), workers=1)
+
+    assert label_lines(tmp_path / 'a.json') == ['0 0.250000 0.500000 0.100000 0.200000']
+    with open(tmp_path / MANIFEST_FILE) as f:
+        assert list(json.load(f)) == ['a.json']
+
+
+def test_unchanged_and_touched_files_are_skipped(tmp_path, capsys):
+    write_labelme(tmp_path / 'a.json', [[50, 50]])
+    convert_labelme_tree(str(tmp_path), workers=1)
+    capsys.readouterr()
+
+    convert_labelme_tree(str(tmp_path), workers=1)
+    assert 'Converted 0 files' in capsys.readouterr().out
+
+    # A new mtime without edits is recognised by the content hash
+    stat = os.stat(tmp_path / 'a.json')
+    os.utime(tmp_path / 'a.json', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    convert_labelme_tree(str(tmp_path), workers=1)
+    output = capsys.readouterr().out
+    assert 'Converted 0 files' in output and '1 files already up to date' in output
+
+
+def test_edited_files_and_missing_labels_are_converted_again(tmp_path):
+    write_labelme(tmp_path / 'a.json', [[50, 50]])
+    write_labelme(tmp_path / 'b.json', [[20, 20]])
+    convert_labelme_tree(str(tmp_path), workers=1)
+
+    write_labelme(tmp_path / 'a.json', [[50, 50], [150, 50]])
+    os.remove(tmp_path / 'b.txt')
+    convert_labelme_tree(str(tmp_path), workers=1)
+
+    assert len(label_lines(tmp_path / 'a.json')) == 2
+    assert len(label_lines(tmp_path / 'b.json')) == 1
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from near_duplicates import cluster_pairs, greedy_representatives, near_duplicate_pairs
+
+# A chain A~B~C (a slow pan): A and B differ by 4 bits, B and C by 4 bits, A and C by 8 bits
+CHAIN = np.array([0b0, 0b1111, 0b11111111], dtype=np.uint64)
+
+
+def test_chain_keeps_frames_far_from_every_kept_image():
+    representatives = greedy_representatives(len(CHAIN), near_duplicate_pairs(CHAIN, max_distance=6))
+    # B is dropped as a duplicate of A, C is more than 6 bits from A so it is kept
+    assert representatives.tolist() == [0, 0, 2]
+
+
+def test_identical_frames_are_dropped():
+    hashes = np.array([5, 5, 5, 1 << 40], dtype=np.uint64)
+    representatives = greedy_representatives(len(hashes), near_duplicate_pairs(hashes, max_distance=0))
+    assert representatives.tolist() == [0, 0, 0, 3]
+
+
+def test_fold_groups_are_capped():
+    pairs = near_duplicate_pairs(CHAIN, max_distance=6)
+    assert len(set(cluster_pairs(len(CHAIN), pairs).tolist())) == 1
+    roots = cluster_pairs(len(CHAIN), pairs, max_group_size=2)
+    assert np.bincount(roots).max() <= 2
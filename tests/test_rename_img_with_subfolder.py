@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing'))
+from rename_img_with_subfolder import (JOURNAL_FILE, add_suffix_to_files_in_folder, plan_renames, resume_renames,
+                                       rollback_renames)
+
+
+def make_tree(root):
+    for folder in ('survey1/images', 'survey1/labels', 'survey2'):
+        (root / folder).mkdir(parents=True)
+    (root / 'survey1' / 'images' / 'a.jpg').write_bytes(b'jpeg')
+    (root / 'survey1' / 'labels' / 'a.txt').write_text('0 0.5 0.5 0.1 0.1\n')
+    (root / 'survey2' / 'b.jpg').write_bytes(b'jpeg')
+    (root / 'survey2' / 'c.jpg').write_bytes(b'jpeg')
+
+
+def file_names(root):
+    return sorted(os.path.relpath(os.path.join(folder, name), root)
+                  for folder, _, names in os.walk(root) for name in names)
+
+
+# Function to write the journal of a run and apply its first renames as an interrupted run would have
+def interrupt_run(root, suffix, applied):
+    plan = plan_renames(str(root), suffix)
+    with open(root / JOURNAL_FILE, 'w') as journal:
+        journal.write(json.dumps({'folder_path': str(root), 'chosen_suffix': suffix}) + '\n')
+        journal.writelines(json.dumps({'source': source, 'target': target}) + '\n' for source, target in plan)
+        # The first rename is recorded, the second happened just before the interruption and is not
+        journal.write(json.dumps({'done': 0}) + '\n')
+    for source, target in plan[:applied]:
+        os.rename(source, target)
+    return plan
+
+
+def test_pair_folders_keep_matching_names(tmp_path):
+    make_tree(tmp_path)
+    add_suffix_to_files_in_folder(str(tmp_path), 'x')
+    assert file_names(tmp_path) == ['survey1/images/a_xsurvey1.jpg', 'survey1/labels/a_xsurvey1.txt',
+                                    'survey2/b_xsurvey2.jpg', 'survey2/c_xsurvey2.jpg']
+
+
+def test_rollback_restores_the_original_names(tmp_path):
+    make_tree(tmp_path)
+    original = file_names(tmp_path)
+    interrupt_run(tmp_path, 'x', applied=2)
+
+    rollback_renames(str(tmp_path))
+    assert file_names(tmp_path) == original
+
+
+def test_resume_finishes_the_interrupted_run(tmp_path):
+    make_tree(tmp_path)
+    plan = interrupt_run(tmp_path, 'x', applied=2)
+
+    resume_renames(str(tmp_path))
+    assert file_names(tmp_path) == sorted(os.path.relpath(target, tmp_path) for _, target in plan)
+
+
+def test_new_run_refuses_to_start_over_a_journal(tmp_path):
+    make_tree(tmp_path)
+    interrupt_run(tmp_path, 'x', applied=1)
+    before = file_names(tmp_path)
+
+    add_suffix_to_files_in_folder(str(tmp_path), 'y')
+    assert file_names(tmp_path) == before